@@ -0,0 +1,178 @@
+import glob
+import os
+import traceback
+
+from tables import resolve_backend
+
+INPUT_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+
+
+def collect_inputs(sources, manifest=None):
+    """Expands files, directories, globs and a manifest into input paths."""
+    paths = []
+    if manifest:
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(line)
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                for name in sorted(files):
+                    if name.lower().endswith(INPUT_EXTENSIONS):
+                        paths.append(os.path.join(root, name))
+        elif glob.has_magic(source):
+            paths.extend(sorted(glob.glob(source, recursive=True)))
+        else:
+            paths.append(source)
+
+    # Keep the first occurrence of each file so repeated inputs run once.
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def output_path_for(input_path, output_dir, root=None):
+    """The JSON file for input_path: its stem, under the same subdirectory
+    of output_dir as the input is under root (default: directly in it)."""
+    directory = output_dir
+    if root is not None:
+        relative = os.path.relpath(os.path.dirname(os.path.abspath(
+            input_path)), os.path.abspath(root))
+        if relative != os.curdir:
+            directory = os.path.join(output_dir, relative)
+    return os.path.join(directory, os.path.splitext(
+        os.path.basename(input_path))[0] + ".json")
+
+
+def output_paths(input_paths, output_dir):
+    """Maps each input to its JSON file, keeping the inputs' directory layout
+    below their common parent so same-named files in different directories
+    do not overwrite each other.
+
+    Raises ValueError when two inputs would still share a file, e.g. inv.pdf
+    and inv.jpg in one directory.
+    """
+    if not input_paths:
+        return {}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path))
+                               for path in input_paths])
+    paths = {}
+    owners = {}
+    for input_path in input_paths:
+        output_path = output_path_for(input_path, output_dir, root)
+        key = os.path.normcase(output_path)
+        if key in owners:
+            raise ValueError(f"{owners[key]} and {input_path} would both be "
+                             f"written to {output_path}")
+        owners[key] = input_path
+        paths[input_path] = output_path
+    return paths
+
+
+def init_worker():
+    # Runs once per worker process: main imports its backends lazily, so
+    # load tabula, PyPDF2, pytesseract and cv2 here and each task after the
+    # first starts warm.
+    import main
+
+    main.preload()
+
+
+def process_one(input_path, output_path, table_backend, cache,
+                return_data=False, profile=None, compact=False):
+    """Extracts one file in a worker; never raises.
+
+    Returns (input_path, ok, error, data, metadata). data is only sent back
+    when return_data is set; otherwise it is written to output_path as JSON,
+    without indentation if compact.
+    """
+    import main
+
+    try:
+        data = main.file_to_data(input_path, table_backend, cache,
+                                 profile=profile or main.FULL_PROFILE)
+        if return_data:
+            return input_path, True, None, data, data["Metadata"]
+        main.write_to_json(output_path, data, compact)
+    except Exception:
+        return (input_path, False, traceback.format_exc(limit=1).strip(),
+                None, None)
+    return input_path, True, None, None, data["Metadata"]
+
+
+def run_batch(input_paths, output_dir="jsons", workers=None,
+              table_backend="tabula", cache=None, writer=None, metrics=None,
+              profile=None, compact=False):
+    """Processes input_paths across a pool of worker processes.
+
+    Without a writer each result is written by the worker to its own JSON
+    file, named by output_paths; ValueError is raised before anything runs
+    if two inputs would share one. With a writer (see writers.open_writer)
+    results are sent back and appended by this process as they complete,
+    so a single writer owns the output files. Each result's metadata is
+    recorded on metrics, a sink from metrics.open_sink, when one is
+    given. profile is a main.OutputProfile (default: every field and the
+    tables); compact drops the indentation from the JSON files.
+
+    Returns a list of (input_path, ok, error) tuples in input order.
+    """
+    from concurrent.futures import (BrokenExecutor, ProcessPoolExecutor,
+                                    as_completed)
+
+    table_backend = resolve_backend(table_backend, len(input_paths))
+    targets = {}
+    if writer is None:
+        targets = output_paths(input_paths, output_dir)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=init_worker) as executor:
+        futures = {}
+        try:
+            for path in input_paths:
+                futures[executor.submit(
+                    process_one, path, targets.get(path), table_backend,
+                    cache, writer is not None, profile, compact)] = path
+        except BrokenExecutor:
+            # The pool broke while files were still being queued; they are
+            # reported below like the ones that were queued.
+            pass
+        for future in as_completed(futures):
+            try:
+                input_path, ok, error, data, metadata = future.result()
+            except BrokenExecutor as e:
+                # A worker died (or the initializer failed): the files the
+                # pool had not finished fail instead of the whole batch
+                # ending in a traceback.
+                input_path, ok, data, metadata = futures[future], False, \
+                    None, None
+                error = f"{type(e).__name__}: {e}"
+            if data is not None:
+                writer.append(input_path, data)
+            if metadata is not None and metrics is not None:
+                metrics.record(metadata)
+            results[input_path] = (input_path, ok, error)
+    for path in input_paths:
+        results.setdefault(path, (path, False,
+                                  "BrokenProcessPool: not run, the worker "
+                                  "pool had stopped"))
+    return [results[path] for path in input_paths]
+
+
+def print_summary(results):
+    failed = 0
+    for input_path, ok, error in results:
+        if ok:
+            print(f"OK      {input_path}")
+        else:
+            failed += 1
+            print(f"FAILED  {input_path}: {error.splitlines()[-1]}")
+    print(f"\n{len(results) - failed} succeeded, {failed} failed, "
+          f"{len(results)} total")
+    return failed
@@ -0,0 +1,87 @@
+"""Micro-benchmark: single-pass field engine vs. the original re.search calls.
+
+Run from the repository root:
+
+    python benchmarks/bench_fields.py [pages ...]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fields import extract_fields  # noqa: E402
+
+LEGACY_PATTERNS = (
+    ("Vendor Name", r"Vendor Name:\s*([^\n]+)", 1),
+    ("Invoice Date", r"(?i)(invoice.*date.*?)(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}"
+                     r"|[a-z]+ \d{1,2}, \d{2,4})", 2),
+    ("Invoice Number", r"(?i)(invoice.*number.*?)([\w-]+)", 2),
+    ("Total Amount", r"(?i)(total.*?due.*?)([\d,]+\.\d{2})", 2),
+)
+
+WORDS = ("invoice", "total", "amount", "due", "balance", "service", "qty",
+         "description", "payment", "account", "statement", "period", "date")
+
+
+def legacy_extract(text):
+    details = {}
+    for field, pattern, group in LEGACY_PATTERNS:
+        match = re.search(pattern, text)
+        details[field] = match.group(group).strip() if match else "Not Found"
+    return details
+
+
+def statement_text(pages, lines_per_page=60, seed=0, flattened=False):
+    """A long statement whose header fields only appear on the last page.
+
+    flattened joins everything into one line and leaves out the invoice
+    number, like PyPDF2 output for PDFs without line breaks in the content
+    stream; that is where the legacy patterns backtrack quadratically.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(pages * lines_per_page):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 14))]
+        lines.append(" ".join(words) + f" {rng.randint(1, 999)}.{rng.randint(10, 99)}")
+    lines += ["Vendor Name: Example Supplies Ltd",
+              "Invoice Date: January 25, 2016",
+              "Total Due $93.50"]
+    if flattened:
+        return " ".join(lines)
+    lines.insert(-2, "Invoice Number: INV-3337")
+    return "\n".join(lines)
+
+
+def best_of(func, text, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(page_counts):
+    print(f"{'layout':>9} {'pages':>6} {'chars':>10} {'legacy ms':>10} "
+          f"{'engine ms':>10}")
+    for flattened in (False, True):
+        for pages in page_counts:
+            text = statement_text(pages, flattened=flattened)
+            # The legacy patterns are quadratic on flattened text; one run
+            # is plenty to make the point.
+            legacy_time, legacy = best_of(legacy_extract, text,
+                                          repeat=1 if flattened else 5)
+            engine_time, engine = best_of(extract_fields, text)
+            if legacy != engine:
+                raise SystemExit(f"results differ at {pages} pages:\n"
+                                 f"{legacy}\n{engine}")
+            layout = "flattened" if flattened else "lines"
+            print(f"{layout:>9} {pages:>6} {len(text):>10} "
+                  f"{legacy_time * 1000:>10.1f} {engine_time * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1, 10, 50, 100])
@@ -0,0 +1,188 @@
+"""End-to-end benchmark of file_to_data over a synthetic invoice corpus.
+
+Each invoice is extracted once (after warm-up) with a StageTimer attached,
+then written to JSON. The report gives throughput, p50/p95 latency per
+document kind and p50/p95/total time per pipeline stage, plus how many of
+the expected header fields were extracted correctly.
+
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py [--count 30] [--tables tabula]
+        [--corpus DIR] [--save results.json] [--baseline old.json]
+
+--corpus reuses (or creates) a corpus directory; otherwise a fresh one is
+generated in a temporary directory. --save writes the summary as JSON and
+--baseline compares against a saved summary, exiting with status 1 when a
+p50 has regressed by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from corpus import KINDS, generate_corpus  # noqa: E402
+from tables import TABLE_BACKENDS  # noqa: E402
+from timing import StageTimer  # noqa: E402
+
+# Differences below this many milliseconds are noise, not regressions.
+NOISE_FLOOR_MS = 5.0
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def load_corpus(corpus_dir, count, seed):
+    manifest_path = os.path.join(corpus_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return generate_corpus(corpus_dir, count, seed)
+
+
+def run(corpus_dir, manifest, table_backend, output_dir):
+    """Extracts every invoice, returning one record per file."""
+    # Warm up imports, the JVM and the OCR pool on the first file of each
+    # kind so the first measured file does not pay for them.
+    warmed = set()
+    for entry in manifest:
+        if entry["kind"] not in warmed:
+            warmed.add(entry["kind"])
+            main.file_to_data(os.path.join(corpus_dir, entry["file"]),
+                              table_backend)
+
+    records = []
+    for entry in manifest:
+        path = os.path.join(corpus_dir, entry["file"])
+        timer = StageTimer()
+        start = time.perf_counter()
+        data = main.file_to_data(path, table_backend, timer=timer)
+        with timer.stage("json"):
+            main.write_to_json(main.output_path_for(path, output_dir), data)
+        elapsed = time.perf_counter() - start
+        details = data["Invoice Details"]
+        correct = sum(details.get(field) == value
+                      for field, value in entry["expected"].items())
+        records.append({"kind": entry["kind"], "pages": entry["pages"],
+                        "seconds": elapsed, "stages": dict(timer.stages),
+                        "correct": correct,
+                        "fields": len(entry["expected"])})
+    return records
+
+
+def summarize(records, table_backend):
+    total_seconds = sum(r["seconds"] for r in records)
+    summary = {
+        "version": main.__version__,
+        "tables": table_backend,
+        "files": len(records),
+        "pages": sum(r["pages"] for r in records),
+        "seconds": total_seconds,
+        "kinds": {},
+        "stages": {},
+    }
+    for kind in sorted({r["kind"] for r in records}):
+        latencies = [r["seconds"] * 1000 for r in records
+                     if r["kind"] == kind]
+        kind_records = [r for r in records if r["kind"] == kind]
+        summary["kinds"][kind] = {
+            "files": len(latencies),
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "accuracy": (sum(r["correct"] for r in kind_records)
+                         / sum(r["fields"] for r in kind_records)),
+        }
+    stage_names = []
+    for r in records:
+        stage_names += [name for name in r["stages"]
+                        if name not in stage_names]
+    for name in stage_names:
+        times = [r["stages"][name] * 1000 for r in records
+                 if name in r["stages"]]
+        summary["stages"][name] = {
+            "files": len(times),
+            "p50_ms": percentile(times, 0.50),
+            "p95_ms": percentile(times, 0.95),
+            "total_ms": sum(times),
+        }
+    return summary
+
+
+def print_summary(summary):
+    seconds = summary["seconds"]
+    print(f"{summary['files']} files, {summary['pages']} pages in "
+          f"{seconds:.2f} s: {summary['files'] / seconds:.2f} files/s, "
+          f"{summary['pages'] / seconds:.2f} pages/s "
+          f"(version {summary['version']}, tables={summary['tables']})")
+    print(f"\n{'kind':<12} {'files':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'fields ok':>10}")
+    for kind, stats in summary["kinds"].items():
+        print(f"{kind:<12} {stats['files']:>6} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['accuracy']:>10.0%}")
+    print(f"\n{'stage':<12} {'files':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'total ms':>10}")
+    for name, stats in summary["stages"].items():
+        print(f"{name:<12} {stats['files']:>6} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['total_ms']:>10.1f}")
+
+
+def regressions(summary, baseline, tolerance):
+    """Lists p50 latencies that grew by more than tolerance since baseline."""
+    found = []
+    for section in ("kinds", "stages"):
+        for name, stats in summary[section].items():
+            old = baseline.get(section, {}).get(name)
+            if old is None:
+                continue
+            new_ms, old_ms = stats["p50_ms"], old["p50_ms"]
+            if (new_ms > old_ms * (1 + tolerance)
+                    and new_ms - old_ms > NOISE_FLOOR_MS):
+                found.append(f"{section[:-1]} {name}: p50 {old_ms:.1f} ms "
+                             f"-> {new_ms:.1f} ms")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=30,
+                        help="invoices to generate (spread over "
+                             f"{', '.join(KINDS)})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus",
+                        help="corpus directory to reuse or create")
+    parser.add_argument("--tables", choices=TABLE_BACKENDS, default="tabula")
+    parser.add_argument("--save", help="write the summary to this JSON file")
+    parser.add_argument("--baseline",
+                        help="summary JSON from an earlier run to compare "
+                             "against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative p50 slowdown (default 0.2)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        corpus_dir = args.corpus or os.path.join(scratch, "corpus")
+        manifest = load_corpus(corpus_dir, args.count, args.seed)
+        records = run(corpus_dir, manifest, args.tables,
+                      os.path.join(scratch, "jsons"))
+    summary = summarize(records, args.tables)
+    print_summary(summary)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(summary, json.load(f), args.tolerance)
+        print()
+        for line in found:
+            print(f"REGRESSION  {line}")
+        print(f"{len(found)} regressions against {args.baseline}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,242 @@
+"""Synthetic invoice corpus for benchmarks, generated offline.
+
+Three kinds of document are produced, each with a random number of line
+items (and therefore pages):
+
+    pdf          born-digital PDF with a text layer and ruled tables
+    scan         a single-page JPEG "photo" with noise, blur and skew
+    scanned_pdf  scanned pages wrapped in a PDF without a text layer
+
+Born-digital PDFs are written directly, so only Pillow and NumPy are needed
+for scans and img2pdf for scanned PDFs. manifest.json in the output
+directory records each file's kind, page count and expected header fields.
+
+    python benchmarks/corpus.py out_dir [count]
+"""
+import json
+import os
+import random
+import sys
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842      # A4 in points
+ROWS_PER_PAGE = 30
+KINDS = ("pdf", "scan", "scanned_pdf")
+SCAN_DPI = 200
+
+VENDORS = ("Example Supplies Ltd", "Northwind Traders", "Acme Office Goods",
+           "Globex Components", "Initech Services")
+ITEMS = ("Printer paper A4", "Toner cartridge", "Desk lamp", "USB-C cable",
+         "Stapler", "Monitor stand", "Notebook pack", "Whiteboard markers",
+         "Support hours", "Delivery")
+COLUMNS = ("Description", "Qty", "Unit Price", "Amount")
+# Left edge of each table column, in points, and the table's right edge.
+COLUMN_X = (50, 300, 370, 460)
+TABLE_RIGHT = 545
+
+
+def make_invoice(rng, index, line_items):
+    items = []
+    for _ in range(line_items):
+        qty = rng.randint(1, 20)
+        price = rng.randint(100, 50000) / 100
+        items.append((rng.choice(ITEMS), str(qty), f"{price:,.2f}",
+                      f"{qty * price:,.2f}"))
+    total = sum(float(item[3].replace(",", "")) for item in items)
+    return {
+        "Vendor Name": rng.choice(VENDORS),
+        "Invoice Date": f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/"
+                        f"{rng.randint(2015, 2025)}",
+        "Invoice Number": f"INV-{index:06d}",
+        "Total Amount": f"{total:,.2f}",
+        "items": items,
+    }
+
+
+def page_layout(invoice):
+    """Lays an invoice out as pages of (texts, rules, table span).
+
+    Texts are (x, y, size, text), rules are horizontal (x1, x2, y) lines and
+    the table span is the (bottom, top) of the vertical column rules, all in
+    PDF points with the origin at the bottom left.
+    """
+    pages = []
+    items = invoice["items"]
+    chunks = [items[i:i + ROWS_PER_PAGE]
+              for i in range(0, len(items), ROWS_PER_PAGE)] or [[]]
+    for page_number, chunk in enumerate(chunks):
+        texts, rules = [], []
+        y = PAGE_HEIGHT - 60
+        if page_number == 0:
+            texts += [(50, y, 18, "INVOICE"),
+                      (50, y - 30, 10, f"Vendor Name: {invoice['Vendor Name']}"),
+                      (50, y - 45, 10,
+                       f"Invoice Number: {invoice['Invoice Number']}"),
+                      (50, y - 60, 10,
+                       f"Invoice Date: {invoice['Invoice Date']}")]
+            y -= 100
+        rows = [COLUMNS] + chunk
+        rules.append((COLUMN_X[0], TABLE_RIGHT, y + 14))
+        for row in rows:
+            for x, cell in zip(COLUMN_X, row):
+                texts.append((x + 4, y, 9, cell))
+            rules.append((COLUMN_X[0], TABLE_RIGHT, y - 6))
+            y -= 20
+        if page_number == len(chunks) - 1:
+            texts.append((COLUMN_X[2], y - 20, 11,
+                          f"Total Due: {invoice['Total Amount']}"))
+        texts.append((PAGE_WIDTH - 110, 30, 8,
+                      f"Page {page_number + 1} of {len(chunks)}"))
+        pages.append((texts, rules, (y + 14, y + 20 * len(rows) + 14)))
+    return pages
+
+
+def _escape(text):
+    return (text.replace("\\", "\\\\").replace("(", "\\(")
+            .replace(")", "\\)"))
+
+
+def write_pdf(path, pages):
+    """Writes a born-digital PDF: Helvetica text plus ruled table grids."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for texts, rules, (table_bottom, table_top) in pages:
+        ops = ["0.5 w"]
+        for x1, x2, y in rules:
+            ops.append(f"{x1} {y} m {x2} {y} l S")
+        for x in COLUMN_X + (TABLE_RIGHT,):
+            ops.append(f"{x} {table_bottom} m {x} {table_top} l S")
+        for x, y, size, text in texts:
+            ops.append(f"BT /F1 {size} Tf {x} {y} Td ({_escape(text)}) Tj ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream)
+                       + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} "
+            f"{PAGE_HEIGHT}] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {content_id} 0 R >>".encode())
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = (f"<< /Type /Pages /Kids [{kids}] "
+                  f"/Count {len(page_ids)} >>").encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += (b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref))
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def _font(size):
+    from PIL import ImageFont
+
+    for name in ("DejaVuSans.ttf", "Arial.ttf", "LiberationSans-Regular.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 only has the small bitmap font.
+        return ImageFont.load_default()
+
+
+def render_scan(page, rng, dpi=SCAN_DPI):
+    """Renders one laid-out page as a noisy, slightly skewed grayscale scan."""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFilter
+
+    scale = dpi / 72
+    width, height = int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    texts, rules, (table_bottom, table_top) = page
+    line_width = max(1, int(scale * 0.75))
+    for x1, x2, y in rules:
+        draw.line([(x1 * scale, height - y * scale),
+                   (x2 * scale, height - y * scale)], fill=0, width=line_width)
+    for x in COLUMN_X + (TABLE_RIGHT,):
+        draw.line([(x * scale, height - table_top * scale),
+                   (x * scale, height - table_bottom * scale)],
+                  fill=0, width=line_width)
+    fonts = {}
+    for x, y, size, text in texts:
+        if size not in fonts:
+            fonts[size] = _font(int(size * scale))
+        # PDF text is placed by its baseline; PIL by the top of the line.
+        draw.text((x * scale, height - (y + size * 0.8) * scale), text,
+                  fill=0, font=fonts[size])
+
+    image = image.rotate(rng.uniform(-3, 3), resample=Image.BILINEAR,
+                         expand=True, fillcolor=255)
+    image = image.filter(ImageFilter.GaussianBlur(rng.uniform(0, 1.2)))
+    pixels = np.asarray(image, dtype=np.float32)
+    pixels += np.random.default_rng(rng.randrange(1 << 32)).normal(
+        0, rng.uniform(4, 14), pixels.shape)
+    # Uneven lighting: a gentle gradient across the page.
+    pixels -= np.linspace(0, rng.uniform(0, 40), pixels.shape[1])[None, :]
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def generate_corpus(out_dir, count=30, seed=0, kinds=KINDS,
+                    max_line_items=90):
+    """Writes count invoices to out_dir and returns the manifest entries."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = []
+    for index in range(count):
+        kind = kinds[index % len(kinds)]
+        # Single-image scans hold one page at most.
+        limit = ROWS_PER_PAGE - 8 if kind == "scan" else max_line_items
+        invoice = make_invoice(rng, index, rng.randint(1, limit))
+        pages = page_layout(invoice)
+        if kind == "pdf":
+            name = f"invoice_{index:04d}.pdf"
+            write_pdf(os.path.join(out_dir, name), pages)
+        elif kind == "scan":
+            name = f"invoice_{index:04d}.jpg"
+            render_scan(pages[0], rng).save(os.path.join(out_dir, name),
+                                            quality=rng.randint(60, 90))
+        elif kind == "scanned_pdf":
+            import io
+
+            import img2pdf
+
+            name = f"invoice_{index:04d}_scanned.pdf"
+            jpegs = []
+            for page in pages:
+                buffer = io.BytesIO()
+                render_scan(page, rng).save(buffer, "JPEG", quality=80,
+                                            dpi=(SCAN_DPI, SCAN_DPI))
+                jpegs.append(buffer.getvalue())
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(img2pdf.convert(jpegs))
+        else:
+            raise ValueError(f"Unknown document kind: {kind}")
+        expected = {field: value for field, value in invoice.items()
+                    if field != "items"}
+        manifest.append({"file": name, "kind": kind, "pages": len(pages),
+                         "line_items": len(invoice["items"]),
+                         "expected": expected})
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+if __name__ == "__main__":
+    if not 2 <= len(sys.argv) <= 3:
+        raise SystemExit(__doc__)
+    entries = generate_corpus(sys.argv[1],
+                              int(sys.argv[2]) if len(sys.argv) == 3 else 30)
+    print(f"Wrote {len(entries)} invoices to {sys.argv[1]}")
@@ -0,0 +1,61 @@
+"""Smoke test of the image pipeline on the bundled example images.
+
+Runs every OCR-free image stage (decode, normalize_document, preprocess and
+the table ruling search) on examples/*.jpg and *.jpeg, plus any extra image
+files or directories given, and exits with status 1 if any image raises.
+Tesseract is not needed, so this runs anywhere the Python dependencies are
+installed:
+
+    python benchmarks/smoke_images.py [/tmp/corpus ...]
+"""
+import glob
+import os
+import sys
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_tables import find_table_regions, ruling_masks  # noqa: E402
+from normalize import find_document_quad, normalize_document  # noqa: E402
+from preprocess import decode_image, preprocess  # noqa: E402
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.tif", "*.tiff")
+
+
+def image_paths(sources):
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for pattern in IMAGE_PATTERNS:
+                paths.extend(glob.glob(os.path.join(source, pattern)))
+        else:
+            paths.append(source)
+    return sorted(paths)
+
+
+def smoke(path):
+    """Runs the image stages on one file; returns a one-line summary."""
+    start = time.perf_counter()
+    gray = decode_image(path)
+    quad = find_document_quad(gray)
+    image = preprocess(normalize_document(gray))
+    tables = find_table_regions(*ruling_masks(image))
+    return (f"{gray.shape[1]}x{gray.shape[0]} -> "
+            f"{image.shape[1]}x{image.shape[0]}, "
+            f"{'page found' if quad is not None else 'no page edge'}, "
+            f"{len(tables)} table(s), "
+            f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    sources = [os.path.join(ROOT, "examples")] + sys.argv[1:]
+    failed = 0
+    for path in image_paths(sources):
+        try:
+            print(f"OK      {path}: {smoke(path)}")
+        except Exception:
+            failed += 1
+            print(f"FAILED  {path}:\n{traceback.format_exc()}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_CACHE_DIR = ".invoice_cache"
+
+
+def file_digest(file_path, chunk_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """On-disk cache of extracted invoice JSON keyed by content and config.
+
+    Entries older than max_age seconds are ignored and removed; evict() also
+    drops the least recently used entries until the cache fits in max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=512 << 20,
+                 max_age=30 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, content, config):
+        """Builds the cache key for a file path or an in-memory buffer."""
+        if isinstance(content, (str, os.PathLike)):
+            content_hash = file_digest(content)
+        else:
+            content_hash = hashlib.sha256(content).hexdigest()
+        # The config carries the extractor version, so upgrading the
+        # extractor never serves results produced by an older one.
+        config_blob = json.dumps(config, sort_keys=True).encode("utf-8")
+        config_hash = hashlib.sha256(config_blob).hexdigest()[:16]
+        return f"{content_hash}-{config_hash}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime > self.max_age:
+            self._remove(path)
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self._remove(path)
+            return None
+        # Bump the access time so eviction keeps recently used entries.
+        os.utime(path, (time.time(), stat.st_mtime))
+        return data
+
+    def put(self, key, data):
+        # Write to a temp file first so concurrent workers never read a
+        # half-written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(key))
+
+    def evict(self):
+        """Removes expired entries, then the least recently used over budget."""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age:
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,166 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+NOT_FOUND = "Not Found"
+
+# A rule reads "<start> ... <label> ... <value>" within a single line, which is
+# what the original "(?i)(invoice.*number.*?)([\w-]+)" style patterns match.
+# Instead of letting one regex backtrack over every split of the line, the
+# engine locates the pieces with plain searches:
+#   start      - the first occurrence on the line begins the match
+#   label      - optional; "first" takes the first occurrence after start
+#                (a lazy ".*?"), "last" the last one that still has a value
+#                after it (a greedy ".*")
+#   value      - the first match of this pattern after the label; group 1 is
+#                the field value
+#   next_line  - when the value is empty, take the next non-blank line
+#   constant   - a fixed value (e.g. the vendor name of a vendor profile);
+#                such rules never look at the text
+FieldRule = namedtuple("FieldRule",
+                       "field start label label_choice value next_line "
+                       "constant", defaults=(None,))
+
+RULES_DIR = os.environ.get("INVOICE_RULES_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rules"))
+
+
+def rule_from_config(config):
+    """Compiles one rule from its JSON description."""
+    if "constant" in config:
+        return FieldRule(config["field"], None, None, None, None, False,
+                         config["constant"])
+    label = config.get("label")
+    return FieldRule(config["field"],
+                     re.compile(config["start"]),
+                     re.compile(label) if label else None,
+                     config.get("label_choice", "first"),
+                     re.compile(config["value"]),
+                     config.get("next_line", False))
+
+
+def load_rules(path):
+    """Loads and compiles the "fields" list of a rules file."""
+    with open(path) as f:
+        return tuple(rule_from_config(config)
+                     for config in json.load(f)["fields"])
+
+
+DEFAULT_RULES = load_rules(os.path.join(RULES_DIR, "default.json"))
+
+
+def _last_label_value(rule, line, labels):
+    # A value found after a later label is also found after every earlier
+    # one, so binary search for the last label with a value after it.
+    lo, hi = 0, len(labels) - 1
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        match = rule.value.search(line, labels[mid])
+        if match is None:
+            hi = mid - 1
+        else:
+            best = match
+            lo = mid + 1
+    return best
+
+
+def match_rule(rule, line):
+    """Returns the value match for rule on line, or None."""
+    start = rule.start.search(line)
+    if start is None:
+        return None
+    position = start.end()
+    if rule.label is None:
+        return rule.value.search(line, position)
+
+    if rule.label_choice == "first":
+        label = rule.label.search(line, position)
+        if label is None:
+            return None
+        return rule.value.search(line, label.end())
+
+    labels = [label.end() for label in rule.label.finditer(line, position)]
+    if not labels:
+        return None
+    return _last_label_value(rule, line, labels)
+
+
+class FieldExtractor:
+    """Extracts fields from text fed in chunks, e.g. one page at a time.
+
+    Chunks are joined exactly as "".join(chunks) would be, but only the
+    current partial line is kept between calls. done turns True as soon as
+    every required field (all of them by default) has a value, at which
+    point the caller can stop reading the document.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, required_fields=None):
+        self.details = {rule.field: NOT_FOUND if rule.constant is None
+                        else rule.constant for rule in rules}
+        self._pending = [rule for rule in rules if rule.constant is None]
+        self._awaiting_value = []
+        self._partial = []
+        if required_fields is None:
+            required_fields = self.details
+        self._required = {rule.field for rule in self._pending
+                          if rule.field in required_fields}
+
+    @property
+    def done(self):
+        return not self._required
+
+    def _found(self, rule, value):
+        self.details[rule.field] = value
+        self._required.discard(rule.field)
+
+    def _feed_line(self, line):
+        if self._awaiting_value and line.strip():
+            for rule in self._awaiting_value:
+                self._found(rule, line.strip())
+            self._awaiting_value = []
+
+        for rule in list(self._pending):
+            match = match_rule(rule, line)
+            if match is None:
+                continue
+            self._pending.remove(rule)
+            value = match.group(1).strip()
+            if value or not rule.next_line:
+                self._found(rule, value)
+            else:
+                self._awaiting_value.append(rule)
+
+    def feed(self, text):
+        if not self._pending and not self._awaiting_value:
+            return
+        lines = text.split("\n")
+        self._partial.append(lines[0])
+        if len(lines) == 1:
+            return
+        self._feed_line("".join(self._partial))
+        for line in lines[1:-1]:
+            if not self._pending and not self._awaiting_value:
+                break
+            self._feed_line(line)
+        self._partial = [lines[-1]]
+
+    def close(self):
+        """Processes the trailing partial line and returns the details."""
+        if self._partial:
+            self._feed_line("".join(self._partial))
+            self._partial = []
+        return self.details
+
+
+def extract_fields(text, rules=DEFAULT_RULES):
+    """Finds every field in one pass over the lines of text.
+
+    Rules are compiled once at import and matched line by line, so no pattern
+    can backtrack across the document, and the scan stops as soon as every
+    field has a value.
+    """
+    extractor = FieldExtractor(rules)
+    extractor.feed(text)
+    return extractor.close()
@@ -0,0 +1,152 @@
+import re
+import string
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from ocr import default_pool
+
+# The layout pass only has to find the labels, so it runs on a page scaled
+# down by this factor; normalize_document leaves text about 28 px tall, so
+# labels are still 14 px high.
+LAYOUT_SCALE = 0.5
+# Words further apart than this many word heights are not one value.
+MAX_WORD_GAP = 3
+
+# field: the Invoice Details key; anchors: label word sequences (lowercase,
+# punctuation stripped) that the value follows; whitelist: characters the
+# value can contain, or None; label: what the value is written after in
+# field_text, a label the default rules (rules/default.json) recognise
+# whichever anchor was found on the page.
+HeaderTarget = namedtuple("HeaderTarget", "field anchors whitelist label")
+
+HEADER_TARGETS = (
+    HeaderTarget("Vendor Name", (("vendor", "name"),), None, "Vendor Name:"),
+    HeaderTarget("Invoice Number",
+                 (("invoice", "number"), ("invoice", "no"),
+                  ("invoice", "#")),
+                 string.ascii_letters + string.digits + "-/#",
+                 "Invoice Number"),
+    HeaderTarget("Invoice Date", (("invoice", "date"),), None,
+                 "Invoice Date"),
+    HeaderTarget("Total Amount",
+                 (("total", "due"), ("total", "amount", "due"),
+                  ("amount", "due"), ("balance", "due")),
+                 string.digits + ".,$", "Total Due"),
+)
+
+
+def _token(text):
+    return re.sub(r"[^\w#]", "", text.lower())
+
+
+def group_lines(words):
+    """Groups words into text lines, top to bottom and left to right."""
+    lines = []
+    for word in sorted(words, key=lambda w: w.top + w.height / 2):
+        center = word.top + word.height / 2
+        if lines and abs(center - lines[-1][0]) <= max(
+                word.height, lines[-1][1]) / 2:
+            lines[-1][2].append(word)
+        else:
+            lines.append([center, word.height, [word]])
+    return [sorted(line, key=lambda w: w.left) for _, _, line in lines]
+
+
+def find_anchor(lines, anchors):
+    """Returns (line index, first word, end word) of the first anchor found."""
+    for line_index, line in enumerate(lines):
+        tokens = [_token(word.text) for word in line]
+        for anchor in anchors:
+            for start in range(len(tokens) - len(anchor) + 1):
+                if tuple(tokens[start:start + len(anchor)]) == anchor:
+                    return line_index, start, start + len(anchor)
+    return None
+
+
+def value_words(lines, line_index, start, end):
+    """The words of the value next to a label: to its right, else below it."""
+    line = lines[line_index]
+    label = line[start:end]
+    max_gap = MAX_WORD_GAP * max(word.height for word in label)
+    # A colon or "#" read as a word of its own belongs to the label.
+    while end < len(line) and not _token(line[end].text).strip("#"):
+        label = line[start:end + 1]
+        end += 1
+    right = label[-1].left + label[-1].width
+    words = []
+    for word in line[end:]:
+        if word.left - right > max_gap:
+            break
+        words.append(word)
+        right = word.left + word.width
+    if words or line_index + 1 >= len(lines):
+        return words
+    left = label[0].left
+    right = label[-1].left + label[-1].width + max_gap
+    return [word for word in lines[line_index + 1]
+            if word.left < right and word.left + word.width > left]
+
+
+def _crop(gray, words, scale):
+    # Bounding box of words in layout coordinates, padded, at full size.
+    height = max(word.height for word in words)
+    pad = height / 3
+    left = min(word.left for word in words) - pad
+    top = min(word.top for word in words) - pad
+    right = max(word.left + word.width for word in words) + pad
+    bottom = max(word.top + word.height for word in words) + pad
+    rows, cols = gray.shape
+    top, bottom = max(0, int(top / scale)), min(rows, int(bottom / scale) + 1)
+    left, right = max(0, int(left / scale)), min(cols, int(right / scale) + 1)
+    return np.ascontiguousarray(gray[top:bottom, left:right])
+
+
+def read_header(gray, ocr_pool=None, targets=HEADER_TARGETS,
+                scale=LAYOUT_SCALE):
+    """OCRs only the header fields of a page image.
+
+    A single pass over a downscaled copy of the page locates the field
+    labels. Only the values next to them are then recognised at full
+    resolution, each as a single text line (--psm 7) restricted to the
+    characters the field can contain.
+
+    Returns (layout_text, field_text, located): the rough text of the
+    whole page, good enough to pick a vendor profile; one line per field
+    read, written after the target's canonical label so the default rules
+    parse it (see HeaderTarget); and the fields whose label was found on
+    the page, read or not.
+    """
+    ocr_pool = ocr_pool or default_pool()
+    small = cv2.resize(gray, None, fx=scale, fy=scale,
+                       interpolation=cv2.INTER_AREA)
+    lines = group_lines(ocr_pool.words(small, psm=11))
+    layout_text = "\n".join(" ".join(word.text for word in line)
+                            for line in lines)
+
+    pending = []
+    located = []
+    for target in targets:
+        anchor = find_anchor(lines, target.anchors)
+        if anchor is None:
+            continue
+        located.append(target.field)
+        line_index, start, end = anchor
+        words = value_words(lines, line_index, start, end)
+        if not words:
+            continue
+        crop = _crop(gray, words, scale)
+        pending.append((target.label, ocr_pool.submit(
+            crop, psm=7, whitelist=target.whitelist)))
+
+    # A crop that reads as nothing is left out: a bare label line would let
+    # the rules take the next field's line as its value. The field stays
+    # missing, and the caller falls back to full-page OCR for it.
+    field_lines = []
+    for label, future in pending:
+        value = future.result().strip().lstrip(":").strip()
+        if value:
+            field_lines.append(f"{label} {value}")
+    field_text = "\n".join(field_lines)
+    return layout_text, field_text, located
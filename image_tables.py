@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+import pandas as pd
+
+from normalize import estimate_text_height
+from ocr import default_pool
+
+# Ruling lines shorter than this many text heights are ignored: longer than
+# any glyph stroke, shorter than the column rules of a two-row table.
+MIN_LINE_TEXT_HEIGHTS = 3
+# Without measurable text, lines shorter than this fraction of the image are.
+MIN_LINE_FRACTION = 0.15
+MIN_TABLE_AREA = 0.01
+# A row/column of the line mask counts as a ruling line when at least this
+# fraction of the table's width/height is covered.
+MIN_RULING_COVERAGE = 0.5
+# Ruling lines closer together than this (in pixels) are the same boundary.
+MIN_CELL_SIZE = 8
+
+
+def ruling_masks(gray, text_height=None):
+    """Returns (horizontal, vertical) masks of the ruling lines in an image.
+
+    Lines are kept when they are at least MIN_LINE_TEXT_HEIGHTS text heights
+    long, so a short table's column rules survive however tall the page is.
+    """
+    binary = cv2.adaptiveThreshold(~gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                   cv2.THRESH_BINARY, 15, -2)
+    height, width = binary.shape
+    if text_height is None:
+        text_height = estimate_text_height(gray)
+    if text_height is None:
+        min_width = int(width * MIN_LINE_FRACTION)
+        min_height = int(height * MIN_LINE_FRACTION)
+    else:
+        min_width = min_height = int(text_height * MIN_LINE_TEXT_HEIGHTS)
+    horizontal_kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT, (max(1, min_width), 1))
+    vertical_kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT, (1, max(1, min_height)))
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, horizontal_kernel)
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, vertical_kernel)
+    return horizontal, vertical
+
+
+def find_table_regions(horizontal, vertical):
+    """Returns (x, y, w, h) boxes of ruled tables, top to bottom."""
+    lines = cv2.dilate(horizontal | vertical, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL,
+                                   cv2.CHAIN_APPROX_SIMPLE)
+    height, width = lines.shape
+    min_area = MIN_TABLE_AREA * width * height
+    boxes = [cv2.boundingRect(contour) for contour in contours]
+    boxes = [box for box in boxes if box[2] * box[3] >= min_area]
+    return sorted(boxes, key=lambda box: (box[1], box[0]))
+
+
+def line_positions(mask, axis, length):
+    """Centres of the ruling lines in mask along axis, including the edges.
+
+    axis=1 sums across each row and returns y positions of horizontal lines;
+    axis=0 returns x positions of vertical lines.
+    """
+    coverage = np.count_nonzero(mask, axis=axis)
+    on = coverage >= MIN_RULING_COVERAGE * length
+    # Runs of consecutive line pixels (a line is several pixels thick)
+    # collapse to their centre.
+    edges = np.diff(np.concatenate(([0], on.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    centres = (starts + ends - 1) // 2
+    size = mask.shape[1 - axis]
+    positions = np.unique(np.concatenate(([0], centres, [size - 1])))
+    keep = np.concatenate(([True], np.diff(positions) >= MIN_CELL_SIZE))
+    return positions[keep]
+
+
+def grid_to_rows(words, row_bounds, col_bounds):
+    """Assigns OCR words to grid cells by the centre of their boxes."""
+    n_rows, n_cols = len(row_bounds) - 1, len(col_bounds) - 1
+    cells = [[[] for _ in range(n_cols)] for _ in range(n_rows)]
+    if not words or n_rows < 1 or n_cols < 1:
+        return [["" for _ in range(n_cols)] for _ in range(n_rows)]
+
+    boxes = np.array([(w.left, w.top, w.width, w.height) for w in words])
+    centre_x = boxes[:, 0] + boxes[:, 2] / 2
+    centre_y = boxes[:, 1] + boxes[:, 3] / 2
+    row_index = np.searchsorted(row_bounds, centre_y) - 1
+    col_index = np.searchsorted(col_bounds, centre_x) - 1
+    inside = ((row_index >= 0) & (row_index < n_rows)
+              & (col_index >= 0) & (col_index < n_cols))
+
+    # Reading order within a cell: top to bottom, then left to right.
+    order = np.lexsort((boxes[:, 0], boxes[:, 1]))
+    for i in order[inside[order]]:
+        cells[row_index[i]][col_index[i]].append(words[i].text)
+    return [[" ".join(cell) for cell in row] for row in cells]
+
+
+def detect_tables(gray, ocr_pool=None, text_height=None):
+    """Finds ruled tables in a grayscale image and returns them as DataFrames.
+
+    Each table region is OCR'd once; words are then placed into the cells of
+    the grid formed by its ruling lines. text_height (in pixels) is measured
+    from the image when not given.
+    """
+    ocr_pool = ocr_pool or default_pool()
+    horizontal, vertical = ruling_masks(gray, text_height)
+    tables = []
+    for x, y, w, h in find_table_regions(horizontal, vertical):
+        region_h = horizontal[y:y + h, x:x + w]
+        region_v = vertical[y:y + h, x:x + w]
+        row_bounds = line_positions(region_h, 1, w)
+        col_bounds = line_positions(region_v, 0, h)
+
+        # Blank out the rulings so Tesseract does not read them as glyphs.
+        region = gray[y:y + h, x:x + w].copy()
+        region[(region_h | region_v) > 0] = 255
+        words = ocr_pool.words(region, psm=6)
+
+        rows = [row for row in grid_to_rows(words, row_bounds, col_bounds)
+                if any(row)]
+        if len(rows) < 2:
+            continue
+        tables.append(pd.DataFrame(rows[1:], columns=rows[0]))
+    return tables
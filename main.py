@@ -1,99 +1,472 @@
+import argparse
 import sys
 import os
-import json
-import re
-import tempfile
-from tabula import read_pdf
-from PyPDF2 import PdfReader
-import pytesseract
-from PIL import Image
-import img2pdf
-import cv2
-import numpy as np
+from collections import namedtuple
+from fields import DEFAULT_RULES, NOT_FOUND, FieldExtractor, extract_fields
+from registry import default_registry
+from sources import PDF, load_source
+from timing import StageTimer, profiled
+from tables import TABLE_BACKENDS, read_tables, resolve_backend
+from cache import DEFAULT_CACHE_DIR, ResultCache
+from batch import collect_inputs, output_path_for, print_summary, run_batch
+from writers import WRITER_FORMATS, dumps, open_writer, table_to_split
+from metrics import open_sink
+
+# Only stdlib and pure-Python modules are imported above. The PDF, OCR and
+# imaging backends (PyPDF2, pdfplumber, tabula, pandas, cv2, numpy, PIL,
+# pytesseract) are imported by the code path that needs them, so --version,
+# --check and cached results start in milliseconds.
+
+__version__ = "0.9.0"
+
+# Backend modules preload() imports, and what --check looks for.
+BACKEND_MODULES = ("pdf_text", "rasterize", "image_tables", "normalize",
+                   "preprocess", "ocr", "pandas", "pdfplumber", "PyPDF2",
+                   "tabula")
+REQUIRED_PACKAGES = (("PyPDF2", "PyPDF2"), ("pdfplumber", "pdfplumber"),
+                     ("pypdfium2", "pypdfium2"), ("tabula", "tabula-py"),
+                     ("pandas", "pandas"), ("numpy", "numpy"),
+                     ("cv2", "opencv-python"), ("PIL", "Pillow"),
+                     ("pytesseract", "pytesseract"))
+# Not required, but the default backend: without it OCR starts a tesseract
+# process per call.
+RECOMMENDED_PACKAGES = (("tesserocr", "tesserocr"),)
+OPTIONAL_PACKAGES = (("jpype", "jpype1"), ("pdf2image", "pdf2image"),
+                     ("orjson", "orjson"), ("pyarrow", "pyarrow"))
+PROGRAMS = (("tesseract", "OCR"), ("pdftoppm", "pdf2image without pypdfium2"),
+            ("java", "tabula without jpype"))
+
+
+def preload():
+    """Imports every installed backend up front, for long-lived workers.
+
+    A backend that is not installed is skipped: a batch may never need it
+    (tabula with --tables python, OCR for PDFs only), and a file that does
+    fails on its own with the ImportError.
+    """
+    import importlib
+
+    for module in BACKEND_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+
+def check_environment():
+    """Reports which backends are installed without importing them.
+
+    Returns the number of required packages that are missing.
+    """
+    import importlib.util
+    import shutil
+
+    missing = 0
+    for module, package in (REQUIRED_PACKAGES + RECOMMENDED_PACKAGES
+                            + OPTIONAL_PACKAGES):
+        found = importlib.util.find_spec(module) is not None
+        required = (module, package) in REQUIRED_PACKAGES
+        if not found and required:
+            missing += 1
+        status = "ok" if found else ("MISSING" if required else "absent")
+        if (module, package) in RECOMMENDED_PACKAGES:
+            package += " (recommended)"
+        elif not required:
+            package += " (optional)"
+        print(f"{status:<8} {package}")
+    for program, purpose in PROGRAMS:
+        status = "ok" if shutil.which(program) else "absent"
+        print(f"{status:<8} {program} ({purpose})")
+    return missing
 
 
 def extract_invoice_details_from_text(text):
-    vendor_name_pattern = r"Vendor Name:\s*([^\n]+)"
-    invoice_date_pattern = r"(?i)(invoice.*date.*?)(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|[a-z]+ \d{1,2}, \d{2,4})"
-    invoice_number_pattern = r"(?i)(invoice.*number.*?)([\w-]+)"
-    total_amount_pattern = r"(?i)(total.*?due.*?)([\d,]+\.\d{2})"
+    # Only the matched vendor's rules run.
+    profile = default_registry().match(text)
+    return extract_fields(text, profile.rules)
+
+
+def extract_invoice_details_from_pages(pages, required_fields=None):
+    # Pages are consumed one at a time and dropped once fed; reading stops
+    # as soon as every required field has been found.
+    extractor = None
+    for page_text in pages:
+        if extractor is None:
+            profile = default_registry().match(page_text)
+            extractor = FieldExtractor(profile.rules, required_fields)
+        extractor.feed(page_text)
+        if extractor.done:
+            break
+    if extractor is None:
+        return extract_fields("")
+    return extractor.close()
+
+
+def load_image(source):
+    # Decode straight from the file's bytes into a grayscale array; OCR and
+    # table detection both work on this one buffer.
+    from preprocess import decode_image
+
+    return decode_image(source)
+
+
+# What the caller needs from an invoice: the Invoice Details fields it
+# requires (None for all of them) and whether it wants the tables. The
+# cascade in file_to_table stops as soon as these are satisfied.
+OutputProfile = namedtuple("OutputProfile", "fields tables")
+FULL_PROFILE = OutputProfile(None, True)
+HEADER_PROFILE = OutputProfile(None, False)
+
+
+def missing_fields(invoice_details, fields=None):
+    return [field for field in (invoice_details if fields is None else fields)
+            if invoice_details.get(field, NOT_FOUND) == NOT_FOUND]
+
+
+def _fill_missing(invoice_details, found, missing):
+    for field in missing:
+        if found.get(field, NOT_FOUND) != NOT_FOUND:
+            invoice_details[field] = found[field]
+
+
+def read_pdf_fields(source, timer, fields=None):
+    # Tiered: the text layer first, then pdfplumber's layout-aware text,
+    # then OCR of the scanned pages. Each tier only runs for the fields the
+    # tiers before it missed, so a clean born-digital PDF never pays for
+    # OCR and usually not for pdfplumber either.
+    from pdf_text import iter_layout_texts, iter_ocr_texts, iter_text_layer
+    from pdf_text import needs_ocr
+
+    scanned = []
+    has_text = False
+
+    def text_layer():
+        nonlocal has_text
+        for number, text in iter_text_layer(source, timer):
+            if needs_ocr(text):
+                scanned.append(number)
+            else:
+                has_text = True
+            yield text
 
-    invoice_details = {}
+    with timer.stage("fields"):
+        pages = timer.timed("text", text_layer())
+        invoice_details = extract_invoice_details_from_pages(pages, fields)
+        pages.close()
 
-    vendor_name_match = re.search(vendor_name_pattern, text)
-    invoice_details["Vendor Name"] = vendor_name_match.group(
-        1).strip() if vendor_name_match else "Not Found"
+    missing = missing_fields(invoice_details, fields)
+    if missing and has_text:
+        with timer.stage("fields"):
+            pages = timer.timed("layout", iter_layout_texts(source))
+            found = extract_invoice_details_from_pages(pages, missing)
+            pages.close()
+        _fill_missing(invoice_details, found, missing)
+        missing = missing_fields(invoice_details, fields)
 
-    invoice_date_match = re.search(invoice_date_pattern, text)
-    invoice_details["Invoice Date"] = invoice_date_match.group(
-        2) if invoice_date_match else "Not Found"
+    if missing and scanned:
+        with timer.stage("fields"):
+            pages = timer.timed("ocr", iter_ocr_texts(source, scanned,
+                                                      timer=timer))
+            found = extract_invoice_details_from_pages(pages, missing)
+            pages.close()
+        _fill_missing(invoice_details, found, missing)
+    return invoice_details
 
-    invoice_number_match = re.search(invoice_number_pattern, text)
-    invoice_details["Invoice Number"] = invoice_number_match.group(
-        2).strip() if invoice_number_match else "Not Found"
 
-    total_amount_match = re.search(total_amount_pattern, text)
-    invoice_details["Total Amount"] = total_amount_match.group(
-        2) if total_amount_match else "Not Found"
+def read_header_fields(image, timer, fields=None):
+    # Region-of-interest OCR: only the values next to the field labels are
+    # recognised at full resolution. A field whose label was found but
+    # whose value could not be read falls back to full-page OCR; one whose
+    # label is not on the page stays Not Found, as full OCR would leave it.
+    from header_ocr import HEADER_TARGETS, read_header
+    from ocr import default_pool
 
+    targets = [target for target in HEADER_TARGETS
+               if fields is None or target.field in fields]
+    with timer.stage("ocr"):
+        layout_text, field_text, located = read_header(image,
+                                                       targets=targets)
+    timer.count("pages")
+    timer.count("ocr_chars", len(layout_text) + len(field_text))
+    with timer.stage("fields"):
+        # field_text uses the default rules' labels whatever the page says;
+        # a vendor profile only adds its constant fields.
+        invoice_details = extract_fields(field_text)
+        profile = default_registry().match(layout_text)
+        for rule in profile.rules:
+            if rule.constant is not None:
+                invoice_details[rule.field] = rule.constant
+    missing = [field for field in missing_fields(invoice_details, fields)
+               if field in located]
+    if missing:
+        with timer.stage("ocr"):
+            text = default_pool().image_to_string(image)
+        timer.count("ocr_pages")
+        timer.count("ocr_chars", len(text))
+        with timer.stage("fields"):
+            full_page = extract_invoice_details_from_text(text)
+        _fill_missing(invoice_details, full_page, missing)
     return invoice_details
 
 
-def file_to_table(file_path):
-    if file_path.lower().endswith('.pdf'):
-        with open(file_path, "rb") as file:
-            pdf = PdfReader(file)
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text()
-        invoice_details = extract_invoice_details_from_text(text)
-        tables = read_pdf(file_path, pages="all", multiple_tables=True)
-    else:  # Assuming the file is an image
-        # Convert the image to a PDF
-        image = Image.open(file_path)
-        pdf_bytes = img2pdf.convert(image.filename)
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as temp_pdf:
-            temp_pdf.write(pdf_bytes)
-            temp_pdf.flush()
-            with open(temp_pdf.name, "rb") as file:
-                pdf = PdfReader(file)
-                text = ""
-                for page in pdf.pages:
-                    text += page.extract_text()
-            invoice_details = extract_invoice_details_from_text(text)
-            tables = read_pdf(temp_pdf.name, pages="all", multiple_tables=True)
+def file_to_table(source, table_backend="tabula", timer=None,
+                  profile=FULL_PROFILE):
+    # source may be a path, bytes, memoryview or binary stream; the type is
+    # taken from its magic bytes, not from a file extension. Only the work
+    # profile asks for is done: tables are skipped unless profile.tables,
+    # and images without tables are OCR'd just around the header fields.
+    timer = timer or StageTimer()
+    with timer.stage("read"):
+        source = load_source(source)
+    if source.kind == PDF and profile.tables and \
+            resolve_backend(table_backend, 1) == "python":
+        # pdfplumber yields each page's text and tables together, so the PDF
+        # is opened and parsed only once. Scanned pages are OCR'd afterwards,
+        # and only while a field is still missing, as in read_pdf_fields.
+        from pdf_text import iter_ocr_texts, iter_plumber_pages, needs_ocr
+
+        tables = []
+        scanned = []
+
+        def plumber_texts():
+            for number, page_text, page_tables in timer.timed(
+                    "pdfplumber", iter_plumber_pages(source, timer)):
+                tables.extend(page_tables)
+                if needs_ocr(page_text):
+                    scanned.append(number)
+                yield page_text
+
+        with timer.stage("fields"):
+            pages = plumber_texts()
+            invoice_details = extract_invoice_details_from_pages(
+                pages, profile.fields)
+            # Fields may be complete early; the tables need every page.
+            for _ in pages:
+                pass
+        missing = missing_fields(invoice_details, profile.fields)
+        if missing and scanned:
+            with timer.stage("fields"):
+                pages = timer.timed("ocr", iter_ocr_texts(source, scanned,
+                                                          timer=timer))
+                found = extract_invoice_details_from_pages(pages, missing)
+                pages.close()
+            _fill_missing(invoice_details, found, missing)
+    elif source.kind == PDF:
+        invoice_details = read_pdf_fields(source, timer, profile.fields)
+        tables = []
+        if profile.tables:
+            with timer.stage("tables"):
+                tables = read_tables([source.path_or_stream()],
+                                     table_backend)[0]
+    else:
+        from image_tables import detect_tables
+        from normalize import normalize_document
+        from ocr import default_pool
+        from preprocess import preprocess
+
+        with timer.stage("decode"):
+            image = load_image(source)
+        with timer.stage("normalize"):
+            image = normalize_document(image)
+        with timer.stage("preprocess"):
+            image = preprocess(image)
+        if not profile.tables:
+            return read_header_fields(image, timer, profile.fields), []
+        if profile.fields == ():
+            # Tables only: detect_tables OCRs each table itself.
+            invoice_details = extract_fields("")
+        else:
+            with timer.stage("ocr"):
+                text = default_pool().image_to_string(image)
+            timer.count("pages")
+            timer.count("ocr_pages")
+            timer.count("ocr_chars", len(text))
+            with timer.stage("fields"):
+                invoice_details = extract_invoice_details_from_text(text)
+        with timer.stage("tables"):
+            tables = detect_tables(image)
 
     return invoice_details, tables
 
 
-def write_to_json(file_path, data):
+def build_output(invoice_details, tables):
+    tables_as_dict = [table_to_split(table) for table in tables or []]
+    return {
+        "Invoice Details": invoice_details,
+        "Tables": tables_as_dict
+    }
+
+
+def file_to_data(source, table_backend="tabula", cache=None, timer=None,
+                 profile=FULL_PROFILE):
+    # The result carries this run's stage timings and counters under
+    # "Metadata"; they are added after caching so a cache hit reports its
+    # own (short) run rather than the original extraction.
+    timer = timer or StageTimer()
+    source = load_source(source)
+    config = {"extractor": "main", "version": __version__,
+              "tables": table_backend, "rules": default_registry().digest}
+    if profile != FULL_PROFILE:
+        config["profile"] = [profile.fields, profile.tables]
+    data = None
+    if cache is not None:
+        with timer.stage("cache"):
+            key = cache.key(source.data, config)
+            data = cache.get(key)
+        timer.count("cache_hits" if data is not None else "cache_misses")
+
+    if data is None:
+        invoice_details, tables = file_to_table(source, table_backend, timer,
+                                                profile)
+        data = build_output(invoice_details, tables)
+        if cache is not None:
+            cache.put(key, data)
+    data["Metadata"] = {"version": __version__, "source": source.name,
+                        **timer.metadata()}
+    return data
+
+
+def write_to_json(file_path, data, compact=False):
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=4)
+    with open(file_path, 'wb') as f:
+        f.write(dumps(data, compact))
 
 
 if __name__ == "__main__":
-    input_file_path = sys.argv[1]
-    output_file_path = os.path.join("jsons", os.path.splitext(
-        os.path.basename(input_file_path))[0] + ".json")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--version", action="version",
+                        version=f"%(prog)s {__version__}")
+    parser.add_argument("--check", action="store_true",
+                        help="list installed backends and exit")
+    parser.add_argument("inputs", nargs="*",
+                        help="invoice files, directories or glob patterns; "
+                             "- reads one invoice from stdin")
+    parser.add_argument("--manifest",
+                        help="text file listing one input path per line")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for batch mode "
+                             "(default: one per CPU)")
+    parser.add_argument("--output-dir", default="jsons")
+    parser.add_argument("--format", choices=("json",) + WRITER_FORMATS,
+                        default="json",
+                        help="json writes one file per invoice; ndjson "
+                             "writes one line per invoice to a single file; "
+                             "csv, parquet and arrow append every invoice to "
+                             "an invoices table and a line_items table")
+    parser.add_argument("--compact", action="store_true",
+                        help="write json without indentation, using orjson "
+                             "when installed")
+    parser.add_argument("--tables", choices=TABLE_BACKENDS, default="tabula",
+                        help="table extraction backend")
+    parser.add_argument("--header-only", action="store_true",
+                        help="extract only the Invoice Details fields; "
+                             "images are OCR'd around the field labels "
+                             "instead of in full")
+    parser.add_argument("--fields",
+                        help="comma-separated Invoice Details fields the "
+                             "output needs (default: all); costlier "
+                             "extraction stages only run while one is "
+                             "missing")
+    parser.add_argument("--timings", action="store_true",
+                        help="print the time spent in each stage")
+    parser.add_argument("--metrics",
+                        help="send per-invoice timings and counters to "
+                             "prometheus:PATH (textfile collector) or "
+                             "statsd://HOST:PORT")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="profile a single-file run and save it to PATH")
+    parser.add_argument("--profiler", choices=("cprofile", "pyinstrument"),
+                        default="cprofile")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always re-extract, ignoring cached results")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-max-mb", type=int, default=512)
+    parser.add_argument("--cache-max-age-days", type=float, default=30)
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if check_environment() else 0)
+
+    fields = None
+    if args.fields:
+        fields = tuple(field.strip() for field in args.fields.split(","))
+        known = {rule.field for rule in DEFAULT_RULES}
+        unknown = [field for field in fields if field not in known]
+        if unknown:
+            parser.error(f"unknown field(s): {', '.join(unknown)}; "
+                         f"choose from {', '.join(sorted(known))}")
+    profile = OutputProfile(fields, not args.header_only)
+
+    input_paths = collect_inputs(args.inputs, args.manifest)
+    if not input_paths:
+        parser.error("no input files")
 
-    invoice_details, tables = file_to_table(input_file_path)
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir, args.cache_max_mb << 20,
+                            args.cache_max_age_days * 24 * 3600)
+
+    from_stdin = args.inputs == ["-"] and not args.manifest
+    single_file = from_stdin or (len(input_paths) == 1 and not args.manifest
+                                 and os.path.isfile(args.inputs[0]))
+    metrics = open_sink(args.metrics) if args.metrics else None
+    if not single_file:
+        if args.profile:
+            parser.error("--profile works on a single input file")
+        writer = None
+        if args.format != "json":
+            writer = open_writer(args.format, args.output_dir)
+        try:
+            results = run_batch(input_paths, args.output_dir, args.workers,
+                                args.tables, cache, writer, metrics,
+                                profile, args.compact)
+        except ValueError as e:
+            # Two inputs would overwrite each other's JSON output.
+            sys.exit(f"error: {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+            if metrics is not None:
+                metrics.close()
+        if cache is not None:
+            cache.evict()
+        sys.exit(1 if print_summary(results) else 0)
+
+    if from_stdin:
+        source = load_source(sys.stdin.buffer.read(), "stdin")
+    else:
+        source = load_source(input_paths[0])
+    output_file_path = output_path_for(source.name, args.output_dir)
+
+    timer = StageTimer()
+    if args.profile:
+        with profiled(args.profile, args.profiler):
+            data = file_to_data(source, resolve_backend(args.tables, 1),
+                                cache, timer, profile)
+    else:
+        data = file_to_data(source, resolve_backend(args.tables, 1), cache,
+                            timer, profile)
+    if cache is not None:
+        cache.evict()
+    if metrics is not None:
+        metrics.record(data["Metadata"])
+        metrics.close()
 
     print("Invoice Details:")
-    print(invoice_details)
+    print(data["Invoice Details"])
 
     print("\nTables:")
-    if tables is not None:
-        tables_as_dict = [table.to_dict('split') for table in tables]
-        for i, table_dict in enumerate(tables_as_dict, 1):
-            print(f"Table {i}:")
-            print(table_dict['data'])
-    else:
-        tables_as_dict = []
+    for i, table_dict in enumerate(data["Tables"], 1):
+        print(f"Table {i}:")
+        print(table_dict['data'])
 
-    data = {
-        "Invoice Details": invoice_details,
-        "Tables": tables_as_dict
-    }
+    with timer.stage("write"):
+        if args.format == "json":
+            write_to_json(output_file_path, data, args.compact)
+        else:
+            with open_writer(args.format, args.output_dir) as writer:
+                writer.append(source.name, data)
 
-    write_to_json(output_file_path, data)
+    if args.timings:
+        print("\nTimings:")
+        print(timer.report())
@@ -1,33 +1,42 @@
-import sys
+import argparse
 import os
 import json
-import re
-import tempfile
-from tabula import read_pdf
-from PyPDF2 import PdfReader
-import pytesseract
-from PIL import Image
-import img2pdf
-import cv2
-import numpy as np
-import textract
+from tables import TABLE_BACKENDS, read_tables
+from sources import PDF, load_source
+from main import (extract_invoice_details_from_pages,
+                  extract_invoice_details_from_text)
+from registry import default_registry
+from cache import DEFAULT_CACHE_DIR, ResultCache
+
+# Backends are imported inside the functions that use them; see main.py.
+
+__version__ = "0.9.0"
 
 # Helper functions for image processing
 
 
 def get_grayscale(image):
+    import cv2
+
     return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
 
 def remove_noise(image):
+    import cv2
+
     return cv2.medianBlur(image, 5)
 
 
 def thresholding(image):
+    import cv2
+
     return cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
 
 def dilate(image):
+    import cv2
+    import numpy as np
+
     kernel = np.ones((5, 5), np.uint8)
     return cv2.dilate(image, kernel, iterations=1)
 
@@ -46,56 +55,38 @@ def dilate(image):
 #     text = pytesseract.image_to_string(img)
 #     return text
 
-# Textract version
+# Pooled Tesseract version
+
 
+def get_string(img_path, img=None):
+    import cv2
+    from ocr import default_pool
 
-def get_string(img_path):
-    text = textract.process(img_path, method='tesseract', encoding='utf-8')
-    text = text.decode('utf-8')
+    if img is None:
+        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    text = default_pool().image_to_string(img)
     print(f"Extracted text from {img_path}:\n{text}\n")
     return text
 
 
-def extract_invoice_details_from_text(text):
-    vendor_name_pattern = r"Vendor Name:\s*([^\n]+)"
-    invoice_date_pattern = r"(?i)(invoice.*date.*?)(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|[a-z]+ \d{1,2}, \d{2,4})"
-    invoice_number_pattern = r"(?i)(invoice.*number.*?)([\w-]+)"
-    total_amount_pattern = r"(?i)(total.*?due.*?)([\d,]+\.\d{2})"
+def file_to_table(source, table_backend="tabula"):
+    source = load_source(source)
+    if source.kind == PDF:
+        from pdf_text import iter_text_layer
 
-    invoice_details = {}
+        pages = (text for _, text in iter_text_layer(source))
+        invoice_details = extract_invoice_details_from_pages(pages)
+        pages.close()
+        tables = read_tables([source.path_or_stream()], table_backend)[0]
+    else:  # The magic bytes say it is an image
+        from image_tables import detect_tables
+        from normalize import normalize_document
+        from preprocess import decode_image, preprocess
 
-    vendor_name_match = re.search(vendor_name_pattern, text)
-    invoice_details["Vendor Name"] = vendor_name_match.group(
-        1).strip() if vendor_name_match else "Not Found"
-
-    invoice_date_match = re.search(invoice_date_pattern, text)
-    invoice_details["Invoice Date"] = invoice_date_match.group(
-        2) if invoice_date_match else "Not Found"
-
-    invoice_number_match = re.search(invoice_number_pattern, text)
-    invoice_details["Invoice Number"] = invoice_number_match.group(
-        2).strip() if invoice_number_match else "Not Found"
-
-    total_amount_match = re.search(total_amount_pattern, text)
-    invoice_details["Total Amount"] = total_amount_match.group(
-        2) if total_amount_match else "Not Found"
-
-    return invoice_details
-
-
-def file_to_table(file_path):
-    if file_path.lower().endswith('.pdf'):
-        with open(file_path, "rb") as file:
-            pdf = PdfReader(file)
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text()
-        invoice_details = extract_invoice_details_from_text(text)
-        tables = read_pdf(file_path, pages="all", multiple_tables=True)
-    else:  # Assuming the file is an image
-        text = get_string(file_path)
+        img = preprocess(normalize_document(decode_image(source)))
+        text = get_string(source.name, img)
         invoice_details = extract_invoice_details_from_text(text)
-        tables = None  # Not attempting table extraction from images for now
+        tables = detect_tables(img)
 
     return invoice_details, tables
 
@@ -107,27 +98,48 @@ def write_to_json(file_path, data):
 
 
 if __name__ == "__main__":
-    input_file_path = sys.argv[1]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file_path")
+    parser.add_argument("--tables", choices=TABLE_BACKENDS, default="tabula",
+                        help="table extraction backend")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always re-extract, ignoring cached results")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    input_file_path = args.input_file_path
     output_file_path = os.path.join("jsons", os.path.splitext(
         os.path.basename(input_file_path))[0] + ".json")
 
-    invoice_details, tables = file_to_table(input_file_path)
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    config = {"extractor": "main2", "version": __version__,
+              "tables": args.tables, "rules": default_registry().digest}
+    data = None
+    if cache is not None:
+        cache_key = cache.key(input_file_path, config)
+        data = cache.get(cache_key)
+
+    if data is None:
+        invoice_details, tables = file_to_table(input_file_path, args.tables)
+        if tables is not None:
+            tables_as_dict = [table.to_dict('split') for table in tables]
+        else:
+            tables_as_dict = []
+
+        data = {
+            "Invoice Details": invoice_details,
+            "Tables": tables_as_dict
+        }
+        if cache is not None:
+            cache.put(cache_key, data)
+            cache.evict()
 
     print("Invoice Details:")
-    print(invoice_details)
+    print(data["Invoice Details"])
 
     print("\nTables:")
-    if tables is not None:
-        tables_as_dict = [table.to_dict('split') for table in tables]
-        for i, table_dict in enumerate(tables_as_dict, 1):
-            print(f"Table {i}:")
-            print(table_dict['data'])
-    else:
-        tables_as_dict = []
-
-    data = {
-        "Invoice Details": invoice_details,
-        "Tables": tables_as_dict
-    }
+    for i, table_dict in enumerate(data["Tables"], 1):
+        print(f"Table {i}:")
+        print(table_dict['data'])
 
     write_to_json(output_file_path, data)
@@ -0,0 +1,115 @@
+import os
+import socket
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+# Counters from StageTimer.metadata() that are exported, and their help text.
+COUNTERS = {
+    "pages": "pages read",
+    "ocr_pages": "pages recognised with OCR",
+    "ocr_chars": "characters produced by OCR",
+    "cache_hits": "results served from the cache",
+    "cache_misses": "results extracted because the cache had none",
+}
+
+
+class PrometheusTextfileSink:
+    """Keeps running totals in node_exporter textfile collector format.
+
+    The file is rewritten atomically at most every flush_interval seconds
+    and on close(), so scrapes never see a partial file.
+    """
+
+    def __init__(self, path, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.invoices = 0
+        self.stage_wall = {}
+        self.stage_cpu = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._last_flush = 0.0
+
+    def record(self, metadata):
+        self.invoices += 1
+        for name, stage in metadata["stages"].items():
+            self.stage_wall[name] = (self.stage_wall.get(name, 0.0)
+                                     + stage["wall_ms"] / 1000)
+            self.stage_cpu[name] = (self.stage_cpu.get(name, 0.0)
+                                    + stage["cpu_ms"] / 1000)
+        for name, value in metadata["counters"].items():
+            if name in self.counters:
+                self.counters[name] += value
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        lines = ["# HELP invoice_extractions_total invoices extracted",
+                 "# TYPE invoice_extractions_total counter",
+                 f"invoice_extractions_total {self.invoices}"]
+        for metric, totals, help_text in (
+                ("invoice_stage_seconds_total", self.stage_wall,
+                 "wall-clock seconds spent per pipeline stage"),
+                ("invoice_stage_cpu_seconds_total", self.stage_cpu,
+                 "CPU seconds spent per pipeline stage")):
+            lines += [f"# HELP {metric} {help_text}",
+                      f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{stage="{name}"}} {seconds:.6f}'
+                      for name, seconds in totals.items()]
+        for name, value in self.counters.items():
+            metric = f"invoice_{name}_total"
+            lines += [f"# HELP {metric} {COUNTERS[name]}",
+                      f"# TYPE {metric} counter",
+                      f"{metric} {value}"]
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+
+class StatsdSink:
+    """Sends each invoice's timings and counters to a StatsD daemon over UDP.
+
+    All metrics for one invoice go out in a single datagram; UDP is fire and
+    forget, so a missing daemon never slows extraction down.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="invoice"):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, metadata):
+        lines = [f"{self.prefix}.extractions:1|c"]
+        for name, stage in metadata["stages"].items():
+            lines.append(f"{self.prefix}.stage.{name}.wall:"
+                         f"{stage['wall_ms']}|ms")
+            lines.append(f"{self.prefix}.stage.{name}.cpu:"
+                         f"{stage['cpu_ms']}|ms")
+        lines += [f"{self.prefix}.{name}:{value}|c"
+                  for name, value in metadata["counters"].items()
+                  if name in COUNTERS]
+        try:
+            self._socket.sendto("\n".join(lines).encode(), self.address)
+        except OSError:
+            pass
+
+    def close(self):
+        self._socket.close()
+
+
+def open_sink(url):
+    """Builds a sink from prometheus:PATH or statsd://HOST:PORT."""
+    if url.startswith("prometheus:"):
+        return PrometheusTextfileSink(url[len("prometheus:"):])
+    if url.startswith("statsd:"):
+        parts = urlsplit(url)
+        return StatsdSink(parts.hostname or "127.0.0.1", parts.port or 8125)
+    raise ValueError(f"Unknown metrics sink: {url} (expected "
+                     "prometheus:PATH or statsd://HOST:PORT)")
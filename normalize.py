@@ -0,0 +1,166 @@
+import cv2
+import numpy as np
+
+# Document detection runs on a copy this size; edges survive, noise doesn't.
+DETECT_SIDE = 500
+# The document must cover at least this fraction of the photo...
+MIN_QUAD_AREA = 0.3
+# ...and be clearly brighter just inside its edge than just outside: paper
+# on a desk, not a ruled table or a box on a flatbed scan, which has the
+# same white paper on both sides.
+MIN_EDGE_CONTRAST = 40
+EDGE_BAND = 5
+# Text height is measured on a copy no larger than this.
+TEXT_SIDE = 1200
+# Tesseract is fastest and most accurate with text around this many pixels
+# tall (roughly 10pt text at 300 DPI).
+TARGET_TEXT_HEIGHT = 28
+MIN_SCALE, MAX_SCALE = 0.25, 2.0
+# Skew below this is left alone; above MAX_SKEW it is not text skew.
+MIN_SKEW, MAX_SKEW = 0.3, 15.0
+
+
+def order_corners(points):
+    """Orders four (x, y) points clockwise from the top-left corner."""
+    sums = points.sum(axis=1)
+    diffs = points[:, 1] - points[:, 0]
+    return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                     points[np.argmax(sums)], points[np.argmax(diffs)]],
+                    dtype=np.float32)
+
+
+def _small(gray):
+    scale = min(1.0, DETECT_SIDE / max(gray.shape))
+    if scale == 1.0:
+        return gray, scale
+    return cv2.resize(gray, None, fx=scale, fy=scale,
+                      interpolation=cv2.INTER_AREA), scale
+
+
+def _edge_contrast(small, quad):
+    # Median brightness in a band just inside the quad minus that in a
+    # band just outside it. A quad filling the whole image has no outside
+    # and counts as a page.
+    mask = np.zeros_like(small)
+    cv2.fillConvexPoly(mask, quad.astype(np.int32), 255)
+    kernel = np.ones((2 * EDGE_BAND + 1, 2 * EDGE_BAND + 1), np.uint8)
+    inside = cv2.subtract(mask, cv2.erode(mask, kernel)) > 0
+    outside = cv2.subtract(cv2.dilate(mask, kernel), mask) > 0
+    if np.count_nonzero(outside) < np.count_nonzero(inside) // 4:
+        return 255.0
+    return float(np.median(small[inside]) - np.median(small[outside]))
+
+
+def find_document_quad(gray):
+    """Returns the corners of the page in a photo, or None if not found.
+
+    A quad is only taken for the page when it is brighter than what
+    surrounds it; scans and screenshots, whose page edge is not visible,
+    return None.
+    """
+    small, scale = _small(gray)
+    edges = cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL,
+                                   cv2.CHAIN_APPROX_SIMPLE)
+    min_area = MIN_QUAD_AREA * small.shape[0] * small.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour,
+                                  0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+        quad = approx.reshape(4, 2)
+        if _edge_contrast(small, quad) >= MIN_EDGE_CONTRAST:
+            return order_corners(quad.astype(np.float32) / scale)
+    return None
+
+
+def estimate_skew(gray):
+    """Returns the text skew in degrees (positive is clockwise)."""
+    small, _ = _small(gray)
+    binary = cv2.threshold(small, 0, 255,
+                           cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    # Smear words into solid text lines, then measure the lines' angles.
+    smeared = cv2.dilate(binary, cv2.getStructuringElement(
+        cv2.MORPH_RECT, (15, 1)))
+    lines = cv2.HoughLinesP(smeared, 1, np.pi / 720, threshold=100,
+                            minLineLength=small.shape[1] // 4, maxLineGap=10)
+    if lines is None:
+        return 0.0
+    # (N, 1, 4) in OpenCV 4, (N, 4) in OpenCV 5.
+    x1, y1, x2, y2 = lines.reshape(-1, 4).T.astype(np.float64)
+    angles = np.degrees(np.arctan2(y2 - y1, x2 - x1))
+    angles = angles[np.abs(angles) < MAX_SKEW]
+    return float(np.median(angles)) if angles.size else 0.0
+
+
+def estimate_text_height(gray):
+    """Median height in pixels of character-sized blobs, or None."""
+    # Labelling a full-size photo costs a label map of 4 bytes per pixel;
+    # glyphs are still several pixels tall at TEXT_SIDE.
+    scale = min(1.0, TEXT_SIDE / max(gray.shape))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale,
+                          interpolation=cv2.INTER_AREA)
+    binary = cv2.threshold(gray, 0, 255,
+                           cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    glyphs = ((heights >= 4) & (heights <= gray.shape[0] // 20)
+              & (widths <= 3 * heights))
+    if np.count_nonzero(glyphs) < 20:
+        return None
+    return float(np.median(heights[glyphs])) / scale
+
+
+def target_scale(gray):
+    """Scale factor that brings the text to TARGET_TEXT_HEIGHT pixels."""
+    text_height = estimate_text_height(gray)
+    if text_height is None:
+        return 1.0
+    return float(np.clip(TARGET_TEXT_HEIGHT / text_height,
+                         MIN_SCALE, MAX_SCALE))
+
+
+def normalize_document(gray):
+    """Crops, deskews and rescales a page image in a single resample.
+
+    When the page outline is visible (a phone photo) it is perspective-
+    corrected and cropped to the page; otherwise residual text skew is
+    rotated out. Either way the output is scaled so that text is about
+    TARGET_TEXT_HEIGHT pixels tall.
+    """
+    scale = target_scale(gray)
+    quad = find_document_quad(gray)
+    if quad is not None:
+        tl, tr, br, bl = quad
+        width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl)) * scale
+        height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr)) * scale
+        width, height = max(1, int(round(width))), max(1, int(round(height)))
+        target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1],
+                           [0, height - 1]], dtype=np.float32)
+        matrix = cv2.getPerspectiveTransform(quad, target)
+        return cv2.warpPerspective(gray, matrix, (width, height),
+                                   flags=cv2.INTER_LINEAR if scale < 1
+                                   else cv2.INTER_CUBIC,
+                                   borderValue=255)
+
+    angle = estimate_skew(gray)
+    if abs(angle) < MIN_SKEW:
+        angle = 0.0
+    if angle == 0.0 and abs(scale - 1.0) < 0.1:
+        return gray
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, scale)
+    new_width = max(1, int(round(width * scale)))
+    new_height = max(1, int(round(height * scale)))
+    # Keep the page centred in the resized output.
+    matrix[0, 2] += new_width / 2 - width / 2
+    matrix[1, 2] += new_height / 2 - height / 2
+    return cv2.warpAffine(gray, matrix, (new_width, new_height),
+                          flags=cv2.INTER_LINEAR if scale < 1
+                          else cv2.INTER_CUBIC,
+                          borderValue=255)
@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Tesseract's own OpenMP threads fight with the pool for cores; one thread
+# per recognition and one recognition per core scales better.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# A recognised word and its bounding box in image pixels.
+Word = namedtuple("Word", "text left top width height conf")
+
+
+class OcrPool:
+    """A pool of long-lived Tesseract workers shared across pages and tiles.
+
+    tesserocr is the default backend: every worker thread owns one
+    TessBaseAPI, so the language data is loaded once per thread instead of
+    once per call and the GIL is released while recognising. When it is not
+    installed, calls fall back to pytesseract on the same threads, which
+    starts a tesseract process per call.
+    """
+
+    def __init__(self, workers=None, lang="eng"):
+        self.lang = lang
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix="ocr")
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def _recognize(self, image, psm=None, whitelist=None):
+        if tesserocr is None:
+            config = f"--psm {psm}" if psm is not None else ""
+            if whitelist:
+                config += f" -c tessedit_char_whitelist={whitelist}"
+            return pytesseract.image_to_string(image, lang=self.lang,
+                                               config=config)
+
+        return self._prepared_api(image, psm, whitelist).GetUTF8Text()
+
+    def _prepared_api(self, image, psm=None, whitelist=None):
+        api = self._api()
+        api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+        api.SetVariable("tessedit_char_whitelist", whitelist or "")
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        api.SetImage(image)
+        return api
+
+    def words(self, image, psm=None):
+        """OCRs one image and returns its words with their bounding boxes."""
+        if tesserocr is None:
+            config = f"--psm {psm}" if psm is not None else ""
+            data = pytesseract.image_to_data(
+                image, lang=self.lang, config=config,
+                output_type=pytesseract.Output.DICT)
+            return [Word(text, left, top, width, height, float(conf))
+                    for text, left, top, width, height, conf in zip(
+                        data["text"], data["left"], data["top"],
+                        data["width"], data["height"], data["conf"])
+                    if text.strip()]
+
+        api = self._prepared_api(image, psm)
+        api.Recognize()
+        words = []
+        iterator = api.GetIterator()
+        level = tesserocr.RIL.WORD
+        for result in tesserocr.iterate_level(iterator, level):
+            text = result.GetUTF8Text(level)
+            box = result.BoundingBox(level)
+            if not text or not text.strip() or box is None:
+                continue
+            left, top, right, bottom = box
+            words.append(Word(text, left, top, right - left, bottom - top,
+                              result.Confidence(level)))
+        return words
+
+    def image_to_string(self, image, psm=None, whitelist=None):
+        """OCRs one image and returns its text."""
+        return self._recognize(image, psm, whitelist)
+
+    def submit(self, image, psm=None, whitelist=None):
+        """Queues one image for OCR and returns a Future of its text."""
+        return self._executor.submit(self._recognize, image, psm, whitelist)
+
+    def map(self, images, psm=None, whitelist=None):
+        """OCRs many images in parallel and returns their texts in order."""
+        return list(self._executor.map(
+            lambda image: self._recognize(image, psm, whitelist), images))
+
+    def close(self):
+        self._executor.shutdown()
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    """Returns the process-wide OCR pool, creating it on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = OcrPool()
+        return _default_pool
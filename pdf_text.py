@@ -0,0 +1,120 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sources import load_source
+from tables import page_tables
+
+# PyPDF2, pdfplumber, the OCR pool and the rasterizer are imported by the
+# functions that use them: a born-digital PDF read from its text layer
+# needs neither OCR nor pdfplumber, and runs without them installed.
+
+# Pages whose text layer has fewer characters than this are treated as scans.
+MIN_TEXT_CHARS = 20
+OCR_DPI = 300
+
+
+def needs_ocr(text):
+    return len(text.strip()) < MIN_TEXT_CHARS
+
+
+def _in_order(futures, lookahead):
+    # Yields the futures' results in order, with at most lookahead of them
+    # submitted ahead of the one being waited on.
+    pending = deque()
+    for future in futures:
+        pending.append(future)
+        if len(pending) > lookahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _count_ocr(future, timer):
+    # Counts a scanned page and, once recognised, its characters.
+    if timer is None:
+        return future
+
+    def count_chars(done):
+        if not done.cancelled() and done.exception() is None:
+            timer.count("ocr_chars", len(done.result()))
+
+    timer.count("ocr_pages")
+    future.add_done_callback(count_chars)
+    return future
+
+
+def iter_text_layer(pdf, timer=None):
+    """Yields (page_number, text) from the text layer alone, without OCR.
+
+    Scanned pages come back with little or no text; see needs_ocr.
+    """
+    from PyPDF2 import PdfReader
+
+    source = load_source(pdf)
+    for number, page in enumerate(PdfReader(source.stream()).pages, 1):
+        if timer is not None:
+            timer.count("pages")
+        yield number, page.extract_text() or ""
+
+
+def iter_layout_texts(pdf):
+    """Yields each page's text as pdfplumber lays it out.
+
+    pdfplumber rebuilds lines from character positions, so it recovers line
+    breaks that PyPDF2 loses on PDFs whose content stream has none.
+    """
+    import pdfplumber
+
+    source = load_source(pdf)
+    with pdfplumber.open(source.stream()) as document:
+        for page in document.pages:
+            text = page.extract_text() or ""
+            page.flush_cache()
+            yield text
+
+
+def iter_ocr_texts(pdf, page_numbers, lookahead=None, ocr_pool=None,
+                   timer=None):
+    """Yields the OCR text of the given (1-based) pages, in order."""
+    from ocr import default_pool
+    from rasterize import PdfRasterizer
+
+    source = load_source(pdf)
+    ocr_pool = ocr_pool or default_pool()
+    lookahead = lookahead or ocr_pool.workers
+    rasterizer = PdfRasterizer(source)
+
+    def ocr_page(page_number):
+        image = rasterizer.render(page_number, OCR_DPI)
+        return ocr_pool.map([image])[0]
+
+    executor = ThreadPoolExecutor(max_workers=lookahead)
+    futures = (_count_ocr(executor.submit(ocr_page, number), timer)
+               for number in page_numbers)
+    try:
+        yield from _in_order(futures, lookahead)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        rasterizer.close()
+
+
+def iter_plumber_pages(pdf, timer=None):
+    """Yields (page_number, text, tables) per page from one pdfplumber pass.
+
+    The PDF is opened and parsed once; each page's text and tables come from
+    the same parsed objects, which are released before the next page.
+    Scanned pages come back with little or no text (see needs_ocr); they
+    are left for the caller to OCR with iter_ocr_texts, and only if their
+    text is still needed.
+    """
+    import pdfplumber
+
+    source = load_source(pdf)
+    with pdfplumber.open(source.stream()) as document:
+        for page in document.pages:
+            if timer is not None:
+                timer.count("pages")
+            text = page.extract_text() or ""
+            tables = page_tables(page)
+            page.flush_cache()
+            yield page.page_number, text, tables
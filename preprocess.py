@@ -0,0 +1,147 @@
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from sources import load_source
+
+# Longest side, in pixels, that OCR is run at: an A4 page at 300 DPI. Phone
+# photos are larger still and gain Tesseract nothing.
+MAX_SIDE = 3508
+
+# Thresholds for picking steps from the image statistics.
+LOW_CONTRAST_STD = 40
+NOISE_LEVEL = 6
+UNEVEN_LIGHTING = 40
+
+ImageStats = namedtuple("ImageStats", "contrast noise lighting_range")
+
+
+def decode_image(image, max_side=MAX_SIDE):
+    """Decodes an image straight to a grayscale array no larger than needed.
+
+    image is anything load_source accepts; its buffer is decoded in place.
+    The size is read from the header first so that large photos are decoded
+    at 1/2, 1/4 or 1/8 scale by libjpeg itself instead of being decoded at
+    full size and shrunk afterwards.
+    """
+    source = load_source(image)
+    with Image.open(source.stream()) as header:
+        longest = max(header.size)
+    flag = cv2.IMREAD_GRAYSCALE
+    for factor, reduced in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                            (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                            (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+        if longest // factor >= max_side:
+            flag = reduced
+            break
+    decoded = cv2.imdecode(np.frombuffer(source.data, dtype=np.uint8), flag)
+    if decoded is None:
+        raise ValueError(f"Could not decode image: {source.name}")
+    return decoded
+
+
+def image_stats(gray):
+    """Cheap statistics taken from a thumbnail and a small centre crop."""
+    height, width = gray.shape
+    scale = 256 / max(height, width)
+    thumb = cv2.resize(gray, (max(1, int(width * scale)),
+                              max(1, int(height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    contrast = float(thumb.std())
+
+    # Paper brightness per tile: a large spread means shadows or a gradient.
+    tiles = [tile for band in np.array_split(thumb, 4, axis=0)
+             for tile in np.array_split(band, 4, axis=1) if tile.size]
+    paper = [np.percentile(tile, 90) for tile in tiles]
+    lighting_range = float(max(paper) - min(paper))
+
+    # Noise: how far pixels sit from their 3x3 median at full resolution.
+    cy, cx = height // 2, width // 2
+    crop = gray[max(0, cy - 128):cy + 128, max(0, cx - 128):cx + 128]
+    residual = cv2.absdiff(crop, cv2.medianBlur(crop, 3))
+    noise = float(np.median(residual)) + float(residual.mean())
+
+    return ImageStats(contrast, noise, lighting_range)
+
+
+def choose_steps(stats):
+    """Picks the preprocessing steps an image needs from its statistics."""
+    steps = []
+    if stats.noise >= NOISE_LEVEL:
+        steps.append("denoise")
+    if stats.lighting_range >= UNEVEN_LIGHTING:
+        # Tesseract's global Otsu threshold fails on shadows; threshold
+        # locally instead.
+        steps.append("adaptive_threshold")
+    elif stats.contrast < LOW_CONTRAST_STD:
+        steps.append("normalize")
+    return steps
+
+
+class Preprocessor:
+    """Composable grayscale preprocessing that reuses its buffers.
+
+    Two working buffers are allocated for the largest image seen and reused
+    for every later image; steps either work in place or ping-pong between
+    the two, so a run allocates nothing once warmed up. The array returned
+    by run() is one of those buffers and is overwritten by the next call.
+    """
+
+    def __init__(self, steps=None, max_side=MAX_SIDE):
+        self.steps = steps
+        self.max_side = max_side
+        self._buffers = [np.empty(0, np.uint8), np.empty(0, np.uint8)]
+
+    def _views(self, shape):
+        size = shape[0] * shape[1]
+        for i, buffer in enumerate(self._buffers):
+            if buffer.size < size:
+                self._buffers[i] = np.empty(size, np.uint8)
+        return [buffer[:size].reshape(shape) for buffer in self._buffers]
+
+    def run(self, gray):
+        height, width = gray.shape
+        scale = min(1.0, self.max_side / max(height, width))
+        shape = (max(1, round(height * scale)), max(1, round(width * scale)))
+        current, spare = self._views(shape)
+        if scale < 1.0:
+            cv2.resize(gray, (shape[1], shape[0]), dst=current,
+                       interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(current, gray)
+
+        steps = self.steps
+        if steps is None:
+            steps = choose_steps(image_stats(current))
+        for step in steps:
+            if step == "normalize":
+                cv2.normalize(current, current, 0, 255, cv2.NORM_MINMAX)
+            elif step == "denoise":
+                cv2.medianBlur(current, 3, dst=spare)
+                current, spare = spare, current
+            elif step == "threshold":
+                cv2.threshold(current, 0, 255,
+                              cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=current)
+            elif step == "adaptive_threshold":
+                cv2.adaptiveThreshold(current, 255,
+                                      cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                      cv2.THRESH_BINARY, 31, 10, dst=spare)
+                current, spare = spare, current
+            else:
+                raise ValueError(f"Unknown preprocessing step: {step}")
+        return current
+
+
+_local = threading.local()
+
+
+def preprocess(gray, steps=None):
+    """Runs the calling thread's shared Preprocessor over gray."""
+    preprocessor = getattr(_local, "preprocessor", None)
+    if preprocessor is None:
+        preprocessor = _local.preprocessor = Preprocessor()
+    preprocessor.steps = steps
+    return preprocessor.run(gray)
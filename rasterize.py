@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sources import Source, load_source
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+DEFAULT_DPI = 300
+
+# PDFium is not thread-safe, not even across documents, so every call into
+# it holds this lock. Threads still pay off: while one page renders, the
+# pages rendered before it are being OCR'd.
+_pdfium_lock = threading.Lock()
+
+
+class PdfRasterizer:
+    """Renders single pages of one PDF to grayscale NumPy arrays, on demand.
+
+    The document is parsed once, on the first render, and kept open; only
+    the pages asked for are rendered, each at the DPI asked for. Without
+    pypdfium2 installed, pages are rendered with poppler via pdf2image.
+    """
+
+    def __init__(self, pdf):
+        self.source = load_source(pdf)
+        self._document = None
+
+    def _open(self):
+        if self._document is None:
+            self._document = pdfium.PdfDocument(
+                self.source.path if self.source.path is not None
+                else self.source.tobytes())
+        return self._document
+
+    def page_count(self):
+        if pdfium is None:
+            from pdf2image import pdfinfo_from_bytes
+
+            return pdfinfo_from_bytes(self.source.tobytes())["Pages"]
+        with _pdfium_lock:
+            return len(self._open())
+
+    def render(self, page_number, dpi=DEFAULT_DPI):
+        """Renders one (1-based) page to a 2-D uint8 array."""
+        if pdfium is None:
+            return _render_poppler(self.source, page_number, dpi)
+        with _pdfium_lock:
+            page = self._open()[page_number - 1]
+            try:
+                bitmap = page.render(scale=dpi / 72, grayscale=True)
+                pixels = bitmap.to_numpy()
+                if pixels.ndim == 3:
+                    pixels = pixels[:, :, 0]
+                # The bitmap's memory belongs to PDFium and is freed with it.
+                return np.array(pixels)
+            finally:
+                page.close()
+
+    def close(self):
+        with _pdfium_lock:
+            if self._document is not None:
+                self._document.close()
+                self._document = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _render_poppler(source, page_number, dpi):
+    from pdf2image import convert_from_bytes, convert_from_path
+
+    options = dict(dpi=dpi, first_page=page_number, last_page=page_number,
+                   grayscale=True)
+    if source.path is not None:
+        image = convert_from_path(source.path, **options)[0]
+    else:
+        image = convert_from_bytes(source.tobytes(), **options)[0]
+    return np.asarray(image)
+
+
+def rasterize_page(pdf, page_number, dpi=DEFAULT_DPI):
+    """Renders a single (1-based) page of a PDF to a grayscale array."""
+    with PdfRasterizer(pdf) as rasterizer:
+        return rasterizer.render(page_number, dpi)
+
+
+_worker_rasterizer = None
+
+
+def _init_render_worker(data, name, path):
+    global _worker_rasterizer
+    _worker_rasterizer = PdfRasterizer(Source(memoryview(data), name, path))
+
+
+def _render_in_worker(page_number, dpi):
+    return page_number, _worker_rasterizer.render(page_number, dpi)
+
+
+def render_pages(pdf, page_numbers=None, dpi=DEFAULT_DPI, processes=None):
+    """Yields (page_number, pixels) for page_numbers (default: all) in order.
+
+    With processes > 1 pages are rendered in that many worker processes,
+    each holding its own copy of the document, since PDFium cannot render
+    on two threads at once.
+    """
+    rasterizer = PdfRasterizer(pdf)
+    try:
+        if page_numbers is None:
+            page_numbers = range(1, rasterizer.page_count() + 1)
+        page_numbers = list(page_numbers)
+        if not processes or processes <= 1:
+            for page_number in page_numbers:
+                yield page_number, rasterizer.render(page_number, dpi)
+            return
+        source = rasterizer.source
+        with ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_render_worker,
+                initargs=(source.tobytes(), source.name,
+                          source.path)) as executor:
+            yield from executor.map(_render_in_worker, page_numbers,
+                                    [dpi] * len(page_numbers))
+    finally:
+        rasterizer.close()
@@ -0,0 +1,91 @@
+import glob
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from fields import DEFAULT_RULES, RULES_DIR, rule_from_config
+
+# Only the start of the document is fingerprinted; vendor logos, names and
+# tax IDs live in the header.
+FINGERPRINT_CHARS = 4000
+# Longest fingerprint phrase, in words, that the registry will match.
+MAX_FINGERPRINT_WORDS = 8
+
+VendorProfile = namedtuple("VendorProfile", "name rules")
+
+DEFAULT_PROFILE = VendorProfile(None, DEFAULT_RULES)
+
+
+def normalize_words(text):
+    """Lowercases text and strips edge punctuation from each word."""
+    words = (word.strip(".,;:()[]\"'").lower() for word in text.split())
+    return [word for word in words if word]
+
+
+class RuleRegistry:
+    """Default field rules plus per-vendor profiles chosen by fingerprint.
+
+    Each profile file in rules/vendors/ names a vendor, the phrases that
+    identify it (logo text, tax ID, ...) and the rules that replace the
+    defaults for that vendor. Fingerprints are stored in a dict keyed by
+    their normalized words, so matching costs a few lookups per word of the
+    first page no matter how many vendors are registered.
+    """
+
+    def __init__(self, rules_dir=RULES_DIR):
+        self.rules_dir = rules_dir
+        self.profiles = {}
+        self.fingerprints = {}
+        self.max_words = 1
+        digest = hashlib.sha256()
+
+        vendor_paths = sorted(glob.glob(os.path.join(rules_dir, "vendors",
+                                                     "*.json")))
+        for path in [os.path.join(rules_dir, "default.json")] + vendor_paths:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        # Part of the result-cache key: editing any rule invalidates results.
+        self.digest = digest.hexdigest()[:16]
+
+        for path in vendor_paths:
+            with open(path) as f:
+                self.add_profile(json.load(f))
+
+    def add_profile(self, config):
+        name = config["vendor"]
+        overrides = {rule.field: rule for rule in
+                     map(rule_from_config, config.get("fields", []))}
+        rules = tuple(overrides.pop(rule.field, rule)
+                      for rule in DEFAULT_RULES) + tuple(overrides.values())
+        self.profiles[name] = VendorProfile(name, rules)
+
+        for phrase in config.get("fingerprint", []):
+            words = normalize_words(phrase)
+            if not words or len(words) > MAX_FINGERPRINT_WORDS:
+                raise ValueError(f"Bad fingerprint for {name}: {phrase!r}")
+            self.fingerprints[tuple(words)] = name
+            self.max_words = max(self.max_words, len(words))
+
+    def match(self, first_page_text):
+        """Returns the profile whose fingerprint appears first on the page."""
+        if not self.fingerprints:
+            return DEFAULT_PROFILE
+        words = normalize_words(first_page_text[:FINGERPRINT_CHARS])
+        for i in range(len(words)):
+            for n in range(1, min(self.max_words, len(words) - i) + 1):
+                name = self.fingerprints.get(tuple(words[i:i + n]))
+                if name is not None:
+                    return self.profiles[name]
+        return DEFAULT_PROFILE
+
+
+_default_registry = None
+
+
+def default_registry():
+    """Returns the registry for RULES_DIR, loading it on first use."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = RuleRegistry()
+    return _default_registry
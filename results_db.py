@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+
+from fields import NOT_FOUND
+from writers import dumps, line_item_rows
+
+DEFAULT_DB_NAME = "invoices.sqlite"
+
+# Invoice dates as the default rules capture them: numeric dates, read
+# month first, and dates with the month spelled out.
+NUMERIC_DATE = re.compile(r"(\d{1,2})[-/](\d{1,2})[-/](\d{2}|\d{4})")
+DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%B %d, %y", "%b %d, %y")
+# Sources looked up per query when replacing stored invoices; below
+# SQLite's default limit on bound parameters.
+LOOKUP_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    vendor_name TEXT COLLATE NOCASE,
+    invoice_number TEXT,
+    invoice_date TEXT,
+    total REAL,
+    raw_invoice_date TEXT,
+    raw_total_amount TEXT,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invoices_vendor
+    ON invoices (vendor_name, invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_number ON invoices (invoice_number);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_total ON invoices (total);
+CREATE TABLE IF NOT EXISTS line_items (
+    invoice_id INTEGER NOT NULL REFERENCES invoices (id),
+    table_index INTEGER NOT NULL,
+    row_index INTEGER NOT NULL,
+    column_index INTEGER NOT NULL,
+    column_name TEXT,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS line_items_invoice ON line_items (invoice_id);
+"""
+
+
+def parse_date(text):
+    """Returns text as an ISO date (YYYY-MM-DD), or None if it is not one."""
+    if not text:
+        return None
+    text = " ".join(text.split())
+    match = NUMERIC_DATE.fullmatch(text)
+    if match is not None:
+        # Most dates are numeric; strptime is slow enough to show in bulk.
+        month, day, year = (int(part) for part in match.groups())
+        if year < 100:
+            year += 2000 if year < 69 else 1900
+        try:
+            return date(year, month, day).isoformat()
+        except ValueError:
+            return None
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_amount(text):
+    """Returns an amount such as "$1,234.56" as a float, or None."""
+    if not text:
+        return None
+    try:
+        return float(text.replace(",", "").replace("$", "").strip())
+    except ValueError:
+        return None
+
+
+def _field(details, field):
+    value = details.get(field)
+    if value is None or value == NOT_FOUND:
+        return None
+    return str(value)
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class SqliteWriter:
+    """Stores invoices in an indexed SQLite database.
+
+    Invoices are buffered and inserted batch_size at a time, each batch in
+    one transaction with executemany. Dates and totals are also stored
+    parsed (ISO text and REAL) so range queries use the indexes. Storing a
+    source that is already present replaces it.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = connect(path)
+        self._pending = []
+
+    def append(self, source, data):
+        self._pending.append((source, data))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        # Later results for a source replace earlier ones in the same batch.
+        batch = list(dict(self._pending).items())
+        self._pending = []
+        added = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._delete([source for source, _ in batch])
+            # BEGIN IMMEDIATE took the write lock, so no other writer can
+            # take these ids; handing them out here lets the line items be
+            # inserted without a lookup per invoice.
+            next_id = self.conn.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM invoices").fetchone()[0]
+            invoices = []
+            line_items = []
+            for invoice_id, (source, data) in enumerate(batch, next_id):
+                details = data["Invoice Details"]
+                raw_date = _field(details, "Invoice Date")
+                raw_total = _field(details, "Total Amount")
+                invoices.append((invoice_id, source,
+                                 _field(details, "Vendor Name"),
+                                 _field(details, "Invoice Number"),
+                                 parse_date(raw_date), parse_amount(raw_total),
+                                 raw_date, raw_total, added))
+                line_items.extend((invoice_id,) + row[1:]
+                                  for row in line_item_rows(source, data))
+            self.conn.executemany(
+                "INSERT INTO invoices (id, source, vendor_name, "
+                "invoice_number, invoice_date, total, raw_invoice_date, "
+                "raw_total_amount, added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                invoices)
+            self.conn.executemany(
+                "INSERT INTO line_items (invoice_id, table_index, row_index, "
+                "column_index, column_name, value) VALUES (?, ?, ?, ?, ?, ?)",
+                line_items)
+
+    def _delete(self, sources):
+        # Only sources stored before need deleting, and usually there are
+        # none, so find them with a few IN queries instead of running two
+        # DELETEs per invoice.
+        ids = []
+        for start in range(0, len(sources), LOOKUP_CHUNK):
+            chunk = sources[start:start + LOOKUP_CHUNK]
+            ids.extend(self.conn.execute(
+                "SELECT id FROM invoices WHERE source IN (%s)"
+                % ", ".join("?" * len(chunk)), chunk))
+        if ids:
+            self.conn.executemany(
+                "DELETE FROM line_items WHERE invoice_id = ?", ids)
+            self.conn.executemany("DELETE FROM invoices WHERE id = ?", ids)
+
+    def close(self):
+        self.flush()
+        # Keeps the planner's statistics current for the query indexes.
+        self.conn.execute("PRAGMA optimize")
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def query_invoices(conn, vendor=None, number=None, date_from=None,
+                   date_to=None, min_total=None, max_total=None, limit=100):
+    """Returns matching invoices as dicts, newest invoice date first.
+
+    vendor matches case-insensitively; a vendor containing % is a LIKE
+    pattern. Dates are ISO strings, both ends inclusive.
+    """
+    clauses = []
+    params = []
+    if vendor is not None:
+        clauses.append("vendor_name LIKE ?" if "%" in vendor
+                       else "vendor_name = ?")
+        params.append(vendor)
+    if number is not None:
+        clauses.append("invoice_number = ?")
+        params.append(number)
+    if date_from is not None:
+        clauses.append("invoice_date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append("invoice_date <= ?")
+        params.append(date_to)
+    if min_total is not None:
+        clauses.append("total >= ?")
+        params.append(min_total)
+    if max_total is not None:
+        clauses.append("total <= ?")
+        params.append(max_total)
+    sql = ("SELECT id, source, vendor_name, invoice_number, invoice_date, "
+           "total FROM invoices")
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    # With a filter, sort what it matches (the unary + keeps SQLite from
+    # walking the date index in order and filtering as it goes, which is
+    # slow when few rows match); without one, walk the date index.
+    sql += (" ORDER BY +invoice_date DESC, id DESC LIMIT ?" if clauses
+            else " ORDER BY invoice_date DESC, id DESC LIMIT ?")
+    cursor = conn.execute(sql, params + [limit])
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+def invoice_tables(conn, invoice_id):
+    """Rebuilds an invoice's tables in the {"columns", "data"} layout."""
+    tables = {}
+    for table_index, row_index, column_index, name, value in conn.execute(
+            "SELECT table_index, row_index, column_index, column_name, value "
+            "FROM line_items WHERE invoice_id = ? "
+            "ORDER BY table_index, row_index, column_index", (invoice_id,)):
+        table = tables.setdefault(table_index, {"columns": {}, "data": {}})
+        table["columns"][column_index] = name
+        table["data"].setdefault(row_index, []).append(value)
+    return [{"columns": [table["columns"][i]
+                         for i in sorted(table["columns"])],
+             "data": [table["data"][i] for i in sorted(table["data"])]}
+            for _, table in sorted(tables.items())]
+
+
+def _split_table(table):
+    # Output of older versions stored tables as lists of records.
+    if isinstance(table, dict):
+        return table
+    columns = list(table[0]) if table else []
+    return {"columns": columns,
+            "data": [[record.get(column) for column in columns]
+                     for record in table]}
+
+
+def load_json_files(paths, db_path):
+    """Stores existing per-file JSON output, keyed by the JSON file's path."""
+    with SqliteWriter(db_path) as writer:
+        for path in paths:
+            with open(path, "rb") as f:
+                data = json.load(f)
+            if "Invoice Details" not in data:
+                print(f"skipping {path}: not an invoice result",
+                      file=sys.stderr)
+                continue
+            data["Tables"] = [_split_table(table) for table in data["Tables"]]
+            writer.append(path, data)
+
+
+def _print_rows(rows):
+    columns = ("invoice_date", "vendor_name", "invoice_number", "total",
+               "source")
+    widths = [max([len(column)] + [len(_text(row[column])) for row in rows])
+              for column in columns]
+    print("  ".join(column.ljust(width)
+                    for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(_text(row[column]).ljust(width)
+                        for column, width in zip(columns, widths)))
+
+
+def _text(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value)
+
+
+def _iso_date(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        pass
+    date = parse_date(text)
+    if date is None:
+        raise argparse.ArgumentTypeError(f"not a date: {text}")
+    return date
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store and query extraction results in SQLite.")
+    parser.add_argument("--db", default=os.path.join("jsons",
+                                                     DEFAULT_DB_NAME),
+                        help="results database (main.py --format sqlite "
+                             "writes OUTPUT_DIR/" + DEFAULT_DB_NAME + ")")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="find stored invoices")
+    query.add_argument("--vendor",
+                       help="vendor name, case-insensitive; %% is a wildcard")
+    query.add_argument("--number", help="invoice number")
+    query.add_argument("--from", dest="date_from", type=_iso_date,
+                       help="earliest invoice date (YYYY-MM-DD or MM/DD/YYYY)")
+    query.add_argument("--to", dest="date_to", type=_iso_date,
+                       help="latest invoice date")
+    query.add_argument("--min-total", type=float)
+    query.add_argument("--max-total", type=float)
+    query.add_argument("--limit", type=int, default=100)
+    query.add_argument("--json", action="store_true",
+                       help="print one JSON object per invoice, with its "
+                            "tables")
+
+    load = commands.add_parser("load",
+                               help="store per-file JSON results from "
+                                    "earlier runs")
+    load.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        load_json_files(args.paths, args.db)
+        sys.exit(0)
+
+    if not os.path.exists(args.db):
+        sys.exit(f"No results database at {args.db}")
+    conn = sqlite3.connect(args.db)
+    rows = query_invoices(conn, args.vendor, args.number, args.date_from,
+                          args.date_to, args.min_total, args.max_total,
+                          args.limit)
+    if args.json:
+        for row in rows:
+            row["Tables"] = invoice_tables(conn, row["id"])
+            sys.stdout.buffer.write(dumps(row) + b"\n")
+    elif rows:
+        _print_rows(rows)
+    conn.close()
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from batch import init_worker
+from cache import DEFAULT_CACHE_DIR, ResultCache
+from metrics import open_sink
+from sources import PDF, detect_kind, load_source
+from tables import TABLE_BACKENDS
+from writers import dumps
+
+MAX_UPLOAD_BYTES = 50 << 20
+# The cache's size and age bounds are enforced after this many extractions.
+EVICT_EVERY = 100
+
+
+class ServiceBusy(Exception):
+    """Raised when the service already has max_pending requests queued."""
+
+
+class UnprocessableInput(Exception):
+    """Raised when a file is a PDF or an image but cannot be read."""
+
+
+def _input_errors():
+    # What the decoders raise for a damaged or unreadable file, as opposed
+    # to a bug or a missing backend.
+    errors = [ValueError]
+    try:
+        from PyPDF2.errors import PyPdfError
+        errors.append(PyPdfError)
+    except ImportError:
+        pass
+    try:
+        from pdfminer.psexceptions import PSException
+        from pdfplumber.utils.exceptions import PdfminerException
+        errors.extend((PSException, PdfminerException))
+    except ImportError:
+        pass
+    try:
+        from pypdfium2 import PdfiumError
+        errors.append(PdfiumError)
+    except ImportError:
+        pass
+    try:
+        from PIL import UnidentifiedImageError
+        errors.append(UnidentifiedImageError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def _extract_in_worker(source, table_backend, cache):
+    import main
+
+    try:
+        return main.file_to_data(source, table_backend, cache)
+    except _input_errors() as e:
+        raise UnprocessableInput(f"{type(e).__name__}: {e}") from None
+
+
+def _backend(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            head = f.read(1024)
+    else:
+        head = memoryview(source)[:1024]
+    return "tabula" if detect_kind(head) == PDF else "tesseract"
+
+
+class ExtractionService:
+    """Runs file_to_data for asyncio callers on a bounded process pool.
+
+    CPU-bound extraction happens in worker processes. Each backend has its
+    own concurrency limit, so a burst of scanned images cannot starve PDFs
+    of workers or the other way round. Once max_pending requests are queued
+    or running, new ones fail fast with ServiceBusy instead of piling up.
+    If a worker dies, the requests it took down fail with BrokenExecutor
+    and the pool is replaced for the ones that follow.
+    """
+
+    def __init__(self, workers=None, max_pending=256, jvm_slots=None,
+                 ocr_slots=None, table_backend="tabula", cache=None,
+                 metrics=None):
+        workers = workers or os.cpu_count() or 1
+        self.workers = workers
+        self.max_pending = max_pending
+        self.table_backend = table_backend
+        self.cache = cache
+        self.metrics = metrics
+        self.pending = 0
+        self._since_evict = 0
+        self._evicting = False
+        self._executor = self._new_executor()
+        self._limits = {
+            "tabula": asyncio.Semaphore(jvm_slots or workers),
+            "tesseract": asyncio.Semaphore(ocr_slots or workers),
+        }
+
+    def _new_executor(self):
+        # Workers are started on first use, while a client's connection is
+        # open; forked ones would inherit its socket and hold it open after
+        # the response is sent.
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=init_worker,
+            mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_executor(self, broken):
+        # Every request on the broken pool fails at once; only the first to
+        # get here replaces it.
+        if self._executor is broken:
+            self._executor = self._new_executor()
+            broken.shutdown(wait=False)
+
+    @property
+    def busy(self):
+        return self.pending >= self.max_pending
+
+    async def extract(self, source):
+        """Extracts one invoice given its path, bytes, memoryview or a
+        binary stream.
+
+        A path is handed to the worker, which reads the file itself;
+        anything else goes as bytes, since memoryviews and streams cannot
+        be pickled. No temporary file is written.
+
+        Raises ValueError for a file that is not a PDF or an image,
+        UnprocessableInput for one that cannot be read and BrokenExecutor
+        when a worker died while extracting it.
+        """
+        if self.busy:
+            raise ServiceBusy()
+        if not isinstance(source, (str, os.PathLike, bytes)):
+            source = load_source(source).tobytes()
+        self.pending += 1
+        try:
+            async with self._limits[_backend(source)]:
+                loop = asyncio.get_running_loop()
+                executor = self._executor
+                try:
+                    future = loop.run_in_executor(
+                        executor, _extract_in_worker, source,
+                        self.table_backend, self.cache)
+                except BrokenExecutor:
+                    # A worker died after the last request finished; this
+                    # one has not run yet, so run it on a fresh pool.
+                    self._replace_executor(executor)
+                    executor = self._executor
+                    future = loop.run_in_executor(
+                        executor, _extract_in_worker, source,
+                        self.table_backend, self.cache)
+                try:
+                    data = await future
+                except BrokenExecutor:
+                    self._replace_executor(executor)
+                    raise
+        finally:
+            self.pending -= 1
+        if self.metrics is not None:
+            self.metrics.record(data["Metadata"])
+        self._maybe_evict()
+        return data
+
+    def _maybe_evict(self):
+        # Workers only ever add to the cache; trim it now and then, on a
+        # thread so the scan of the cache directory does not stall the loop.
+        if self.cache is None or self._evicting:
+            return
+        self._since_evict += 1
+        if self._since_evict < EVICT_EVERY:
+            return
+        self._since_evict = 0
+        self._evicting = True
+        future = asyncio.get_running_loop().run_in_executor(
+            None, self.cache.evict)
+        future.add_done_callback(self._evicted)
+
+    def _evicted(self, future):
+        self._evicting = False
+        if not future.cancelled() and future.exception() is not None:
+            print(f"cache eviction failed: {future.exception()}",
+                  file=sys.stderr)
+
+    def close(self):
+        self._executor.shutdown()
+        if self.cache is not None:
+            self.cache.evict()
+        if self.metrics is not None:
+            self.metrics.close()
+
+    async def handle_http(self, reader, writer):
+        """Serves POST /extract (body: the invoice file) and GET /health."""
+        try:
+            status, body, extra = await self._route(reader)
+        except (asyncio.IncompleteReadError, ValueError):
+            status, body, extra = 400, {"error": "bad request"}, {}
+        payload = dumps(body)
+        headers = {"Content-Type": "application/json",
+                   "Content-Length": str(len(payload)),
+                   "Connection": "close", **extra}
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\n".encode())
+        for name, value in headers.items():
+            writer.write(f"{name}: {value}\r\n".encode())
+        writer.write(b"\r\n" + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, reader):
+        request_line = await reader.readline()
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if method == "GET" and target == "/health":
+            return 200, {"pending": self.pending,
+                         "max_pending": self.max_pending}, {}
+        if method != "POST" or target != "/extract":
+            return 404, {"error": "not found"}, {}
+
+        # Refuse before reading the upload so a busy service costs clients
+        # nothing but a round trip.
+        if self.busy:
+            return 503, {"error": "busy"}, {"Retry-After": "1"}
+        length = int(headers.get("content-length", 0))
+        if length <= 0:
+            return 411, {"error": "Content-Length required"}, {}
+        if length > MAX_UPLOAD_BYTES:
+            return 413, {"error": "upload too large"}, {}
+        upload = await reader.readexactly(length)
+        try:
+            return 200, await self.extract(upload), {}
+        except ValueError as e:
+            # Not a PDF or image (detect_kind).
+            return 415, {"error": str(e)}, {}
+        except UnprocessableInput as e:
+            return 422, {"error": str(e)}, {}
+        except ServiceBusy:
+            return 503, {"error": "busy"}, {"Retry-After": "1"}
+        except BrokenExecutor:
+            # The pool has been replaced; the same upload may well succeed.
+            return 503, {"error": "worker restarted"}, {"Retry-After": "1"}
+        except Exception as e:
+            print(f"extraction failed: {type(e).__name__}: {e}",
+                  file=sys.stderr)
+            return 500, {"error": "internal error"}, {}
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            411: "Length Required", 413: "Payload Too Large",
+            415: "Unsupported Media Type",
+            422: "Unprocessable Entity", 500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+_default_service = None
+
+
+async def extract(path_or_bytes):
+    """Extracts one invoice on the shared default ExtractionService.
+
+    Takes a path, bytes, memoryview or binary stream.
+    """
+    global _default_service
+    if _default_service is None:
+        _default_service = ExtractionService()
+    return await _default_service.extract(path_or_bytes)
+
+
+async def serve(host="127.0.0.1", port=8080, **service_options):
+    service = ExtractionService(**service_options)
+    server = await asyncio.start_server(service.handle_http, host, port)
+    print(f"Listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=256,
+                        help="requests queued or running before new ones "
+                             "are refused with 503")
+    parser.add_argument("--jvm-slots", type=int, default=None,
+                        help="concurrent PDF extractions (default: workers)")
+    parser.add_argument("--ocr-slots", type=int, default=None,
+                        help="concurrent image extractions "
+                             "(default: workers)")
+    parser.add_argument("--tables", choices=TABLE_BACKENDS, default="tabula",
+                        help="table extraction backend")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always re-extract, ignoring cached results")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-max-mb", type=int, default=512)
+    parser.add_argument("--cache-max-age-days", type=float, default=30)
+    parser.add_argument("--metrics",
+                        help="prometheus:PATH or statsd://HOST:PORT")
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.port, workers=args.workers,
+                      max_pending=args.max_pending,
+                      jvm_slots=args.jvm_slots, ocr_slots=args.ocr_slots,
+                      table_backend=args.tables,
+                      cache=None if args.no_cache
+                      else ResultCache(args.cache_dir,
+                                       args.cache_max_mb << 20,
+                                       args.cache_max_age_days * 24 * 3600),
+                      metrics=open_sink(args.metrics) if args.metrics
+                      else None))
@@ -0,0 +1,133 @@
+import io
+import os
+
+PDF = "pdf"
+IMAGE = "image"
+
+# PDF allows junk before the header, so it is looked for in the first 1 KiB,
+# after the image signatures, which must be at the very start.
+PDF_MAGIC = b"%PDF-"
+IMAGE_MAGIC = (
+    b"\xff\xd8\xff",            # JPEG
+    b"\x89PNG\r\n\x1a\n",       # PNG
+    b"II*\x00", b"MM\x00*",     # TIFF
+    b"BM",                      # BMP
+    b"GIF87a", b"GIF89a",
+)
+
+
+def detect_kind(head):
+    """Tells a PDF from an image by its leading bytes."""
+    head = bytes(head[:1024])
+    if head.startswith(IMAGE_MAGIC) or (head[:4] == b"RIFF"
+                                        and head[8:12] == b"WEBP"):
+        return IMAGE
+    if PDF_MAGIC in head:
+        return PDF
+    raise ValueError("Unrecognised file type: not a PDF or a supported image")
+
+
+class MemoryStream(io.RawIOBase):
+    """A read-only, seekable binary stream over a memoryview.
+
+    Unlike io.BytesIO(view) it does not copy the buffer up front; each read
+    copies only the bytes it returns.
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._data.nbytes
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def read(self, size=-1):
+        end = self._data.nbytes if size is None or size < 0 \
+            else self._pos + size
+        chunk = self._data[self._pos:end].tobytes()
+        self._pos += len(chunk)
+        return chunk
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        chunk = self._data[self._pos:self._pos + len(buffer)]
+        size = chunk.nbytes
+        memoryview(buffer).cast("B")[:size] = chunk
+        self._pos += size
+        return size
+
+
+class Source:
+    """An invoice held in memory, whatever it was given as.
+
+    data is a read-only memoryview over the original buffer: bytes,
+    bytearray and BytesIO inputs are never copied. path is kept when the
+    invoice came from a file so tools that want a path can still have it.
+    """
+
+    def __init__(self, data, name, path=None):
+        self.data = data
+        self.name = name
+        self.path = path
+        self.kind = detect_kind(data)
+
+    def stream(self):
+        """A fresh binary stream over data, for PyPDF2, PIL and pdfplumber."""
+        # BytesIO shares a bytes object instead of copying it; any other
+        # buffer would be copied, so it is read in place.
+        if isinstance(self.data.obj, bytes) and \
+                self.data.nbytes == len(self.data.obj):
+            return io.BytesIO(self.data.obj)
+        return MemoryStream(self.data)
+
+    def path_or_stream(self):
+        return self.path if self.path is not None else self.stream()
+
+    def tobytes(self):
+        if isinstance(self.data.obj, bytes) and \
+                self.data.nbytes == len(self.data.obj):
+            return self.data.obj
+        return self.data.tobytes()
+
+
+def load_source(source, name=None):
+    """Wraps a path, bytes, bytearray, memoryview or binary stream in a Source.
+
+    A Source is returned unchanged, so functions can call this on whatever
+    they are handed.
+    """
+    if isinstance(source, Source):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        with open(path, "rb") as f:
+            data = f.read()
+        return Source(memoryview(data), name or path, path)
+    if isinstance(source, (bytes, bytearray)):
+        return Source(memoryview(source).toreadonly(), name or "<bytes>")
+    if isinstance(source, memoryview):
+        return Source(source.cast("B").toreadonly(), name or "<bytes>")
+    if isinstance(source, io.BytesIO):
+        return Source(source.getbuffer().toreadonly(), name or "<stream>")
+    if hasattr(source, "read"):
+        return Source(memoryview(source.read()),
+                      name or getattr(source, "name", "<stream>"))
+    raise TypeError(f"Cannot read an invoice from {type(source).__name__}")
@@ -0,0 +1,74 @@
+import importlib.util
+
+# pandas, pdfplumber and tabula are imported where they are used, so that
+# importing this module for TABLE_BACKENDS or resolve_backend stays cheap.
+
+# Below this many PDFs the "auto" backend skips the JVM entirely; starting
+# it costs more than parsing a handful of files in Python.
+JVM_MIN_BATCH = 8
+
+TABLE_BACKENDS = ("tabula", "python", "auto")
+
+
+def jvm_available():
+    """Returns True when tabula can run inside this process through jpype."""
+    return importlib.util.find_spec("jpype") is not None
+
+
+def read_tables_jvm(pdf_paths):
+    """Extracts tables from many PDFs with a single, reused in-process JVM."""
+    # With jpype installed tabula starts the JVM on the first call and keeps
+    # it for the life of the process, so every later file skips the startup.
+    from tabula import read_pdf
+
+    results = []
+    for pdf_path in pdf_paths:
+        results.append(read_pdf(pdf_path, pages="all", multiple_tables=True,
+                                force_subprocess=not jvm_available()))
+    return results
+
+
+def page_tables(page):
+    """Converts the tables pdfplumber finds on one page to DataFrames."""
+    import pandas as pd
+
+    tables = []
+    for rows in page.extract_tables():
+        if not rows:
+            continue
+        # Same shape as tabula: the first row becomes the header.
+        tables.append(pd.DataFrame(rows[1:], columns=rows[0]))
+    return tables
+
+
+def read_tables_python(pdf_paths):
+    """Extracts tables from many PDFs with pdfplumber, without a JVM."""
+    import pdfplumber
+
+    results = []
+    for pdf_path in pdf_paths:
+        tables = []
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages:
+                tables.extend(page_tables(page))
+        results.append(tables)
+    return results
+
+
+def resolve_backend(backend, batch_size):
+    """Turns "auto" into a concrete backend for a batch of batch_size PDFs."""
+    if backend not in TABLE_BACKENDS:
+        raise ValueError(f"Unknown table backend: {backend}")
+    if backend != "auto":
+        return backend
+    use_jvm = jvm_available() and batch_size >= JVM_MIN_BATCH
+    return "tabula" if use_jvm else "python"
+
+
+def read_tables(pdf_paths, backend="tabula"):
+    """Returns one list of DataFrames per PDF in pdf_paths."""
+    pdf_paths = list(pdf_paths)
+    backend = resolve_backend(backend, len(pdf_paths))
+    if backend == "python":
+        return read_tables_python(pdf_paths)
+    return read_tables_jvm(pdf_paths)
@@ -0,0 +1,118 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Accumulates wall-clock and CPU seconds per named pipeline stage.
+
+    Stages may nest; time spent in an inner stage is only counted there, so
+    the stages always add up to the total. CPU time is the whole process's,
+    so it includes OCR and rendering threads working for the stage.
+
+    count() keeps named counters (pages, OCR characters, cache hits) and is
+    safe to call from worker threads.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.cpu = {}
+        self.counters = {}
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        # [name, wall start, cpu start, wall in nested stages, cpu in nested]
+        frame = [name, time.perf_counter(), time.process_time(), 0.0, 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            cpu = time.process_time() - frame[2]
+            self.stages[name] = (self.stages.get(name, 0.0)
+                                 + elapsed - frame[3])
+            self.cpu[name] = self.cpu.get(name, 0.0) + cpu - frame[4]
+            if self._stack:
+                self._stack[-1][3] += elapsed
+                self._stack[-1][4] += cpu
+
+    def timed(self, name, iterable):
+        """Yields from iterable, charging the time of each step to name."""
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self.stage(name):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def metadata(self):
+        """Stage timings and counters as a JSON-ready dict."""
+        return {
+            "stages": {name: {"wall_ms": round(seconds * 1000, 3),
+                              "cpu_ms": round(self.cpu[name] * 1000, 3)}
+                       for name, seconds in self.stages.items()},
+            "wall_ms": round(sum(self.stages.values()) * 1000, 3),
+            "cpu_ms": round(sum(self.cpu.values()) * 1000, 3),
+            "counters": dict(self.counters),
+        }
+
+    def report(self):
+        lines = [f"{'stage':<10} {'wall':>12} {'cpu':>12}"]
+        lines += [f"{name:<10} {seconds * 1000:9.1f} ms "
+                  f"{self.cpu[name] * 1000:9.1f} ms"
+                  for name, seconds in self.stages.items()]
+        total = sum(self.stages.values())
+        cpu = sum(self.cpu.values())
+        lines.append(f"{'total':<10} {total * 1000:9.1f} ms "
+                     f"{cpu * 1000:9.1f} ms")
+        lines += [f"{name:<10} {value:>12}"
+                  for name, value in self.counters.items()]
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiled(path, profiler="cprofile"):
+    """Profiles the enclosed block and saves the result to path.
+
+    cprofile writes pstats data (open it with snakeviz or pstats) and prints
+    the top functions by cumulative time; pyinstrument, if installed, writes
+    an HTML report.
+    """
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(path, "w") as f:
+                f.write(profile.output_html())
+        return
+
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(15)
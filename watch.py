@@ -0,0 +1,544 @@
+import argparse
+import ctypes
+import os
+import select
+import sqlite3
+import struct
+import sys
+import time
+from concurrent.futures import (FIRST_COMPLETED, BrokenExecutor,
+                                ProcessPoolExecutor, wait)
+
+from batch import INPUT_EXTENSIONS, init_worker, output_path_for, process_one
+from cache import DEFAULT_CACHE_DIR, ResultCache, file_digest
+from tables import JVM_MIN_BATCH, TABLE_BACKENDS, resolve_backend
+
+DEFAULT_STATE_DB = ".invoice_state.sqlite"
+# The result cache is trimmed to its bounds after this many files.
+EVICT_EVERY = 100
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# inotify(7) event bits.
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct("iIII")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    sha256 TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    parent TEXT
+);
+"""
+# dirs.mtime_ns of a directory that has been seen but not yet listed.
+UNLISTED = -1
+
+
+class StateDB:
+    """Which input files have been seen and what became of them.
+
+    files holds each file's size, mtime, status and the SHA-256 of the
+    content last processed successfully; dirs holds each directory's mtime
+    and parent, so a scan only lists directories that changed since the
+    last one and finds the subdirectories of the others here.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in
+                   self.conn.execute("PRAGMA table_info(dirs)")]
+        if "parent" not in columns:
+            # Older databases did not record subdirectories; forgetting the
+            # mtimes makes the next scan list every directory once.
+            self.conn.execute("ALTER TABLE dirs ADD COLUMN parent TEXT")
+            self.conn.execute("DELETE FROM dirs")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)")
+        self.conn.commit()
+
+    def dir_mtime(self, directory):
+        row = self.conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?",
+                                (directory,)).fetchone()
+        return row[0] if row else None
+
+    def set_dir_mtime(self, directory, mtime_ns):
+        self.conn.execute(
+            "INSERT INTO dirs (path, mtime_ns) VALUES (?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns",
+            (directory, mtime_ns))
+
+    def subdirectories(self, directory):
+        return [path for path, in self.conn.execute(
+            "SELECT path FROM dirs WHERE parent = ?", (directory,))]
+
+    def set_subdirectories(self, directory, subdirectories):
+        """Records the subdirectories found by listing directory; new ones
+        are UNLISTED until they are scanned themselves."""
+        self.conn.executemany(
+            "INSERT INTO dirs (path, mtime_ns, parent) VALUES (?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET parent = excluded.parent",
+            [(path, UNLISTED, directory) for path in subdirectories])
+        gone = set(self.subdirectories(directory)) - set(subdirectories)
+        self.conn.executemany("DELETE FROM dirs WHERE path = ?",
+                              [(path,) for path in gone])
+
+    def known_files(self, directory):
+        """Maps each recorded file in directory to its (size, mtime_ns)."""
+        return {path: (size, mtime_ns) for path, size, mtime_ns in
+                self.conn.execute("SELECT path, size, mtime_ns FROM files "
+                                  "WHERE dir = ?", (directory,))}
+
+    def files(self):
+        """Returns (path, size, mtime_ns) for every recorded file."""
+        return self.conn.execute(
+            "SELECT path, size, mtime_ns FROM files").fetchall()
+
+    def mark_pending(self, files):
+        """Queues (path, size, mtime_ns) entries that are new or changed."""
+        self.conn.executemany(
+            "INSERT INTO files (path, dir, size, mtime_ns, status, updated) "
+            "VALUES (?, ?, ?, ?, 'pending', ?) "
+            "ON CONFLICT (path) DO UPDATE SET size = excluded.size, "
+            "mtime_ns = excluded.mtime_ns, status = 'pending', error = NULL, "
+            "updated = excluded.updated",
+            [(path, os.path.dirname(path), size, mtime_ns, time.time())
+             for path, size, mtime_ns in files])
+
+    def pending(self, limit):
+        """Returns up to limit queued files as (path, size, mtime_ns, sha256
+        of the last good run)."""
+        return self.conn.execute(
+            "SELECT path, size, mtime_ns, sha256 FROM files "
+            "WHERE status = 'pending' ORDER BY rowid LIMIT ?",
+            (limit,)).fetchall()
+
+    def same_stem(self, path):
+        """Files recorded before path, in its directory, not failed and with
+        the same name but another extension; they share its JSON file."""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return [other for other, in self.conn.execute(
+                    "SELECT path FROM files WHERE dir = ? AND status != "
+                    "'failed' AND rowid < (SELECT rowid FROM files WHERE "
+                    "path = ?) ORDER BY rowid",
+                    (os.path.dirname(path), path))
+                if os.path.splitext(os.path.basename(other))[0] == stem]
+
+    def finish(self, path, size, mtime_ns, status, sha256=None, error=None):
+        """Records the outcome for the version of path with this size and
+        mtime. If the file has been queued again since (changed while it
+        was being processed), the row is left pending."""
+        if status == DONE:
+            self.conn.execute(
+                "UPDATE files SET status = ?, sha256 = ?, error = NULL, "
+                "updated = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (status, sha256, time.time(), path, size, mtime_ns))
+        else:
+            self.conn.execute(
+                "UPDATE files SET status = ?, error = ?, updated = ? "
+                "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (status, error, time.time(), path, size, mtime_ns))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class Inotify:
+    """Minimal Linux inotify through ctypes; no third-party package needed."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                          WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"cannot watch {directory}: "
+                                 f"{os.strerror(errno)}")
+        self.watches[wd] = directory
+
+    def read(self, timeout):
+        """Waits up to timeout seconds and returns (path, mask) events."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = buffer[offset:offset + length].rstrip(b"\0")
+            offset += length
+            directory = self.watches.get(wd)
+            if directory is not None or mask & IN_Q_OVERFLOW:
+                path = os.path.join(directory, os.fsdecode(name)) \
+                    if directory is not None else None
+                events.append((path, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _is_input(name):
+    return name.lower().endswith(INPUT_EXTENSIONS)
+
+
+class Watcher:
+    """Processes new and changed invoices dropped into a folder tree.
+
+    Each file's JSON goes to the same subdirectory of output_dir as the
+    file is under root. The state DB makes the work incremental: a file is
+    processed again only when its size or mtime changes and its content
+    hash differs from the last successful run, and a restart picks up the
+    queue where it stopped. inotify is used where available, polling
+    otherwise.
+
+    Directory scans only notice files being added, renamed or removed.
+    A file rewritten in place is seen by inotify while the watcher runs.
+    Setting recheck_interval (seconds) adds a stat-only pass over every
+    known file, run on startup to catch edits made while the watcher was
+    stopped and then, when polling, every recheck_interval seconds.
+    """
+
+    def __init__(self, root, db, output_dir="jsons", workers=None,
+                 table_backend="tabula", cache=None, poll_interval=2.0,
+                 settle=2.0, use_inotify=True, recheck_interval=0):
+        self.root = os.path.abspath(root)
+        self.db = db
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        # A daemon sees many files over its life, so "auto" picks as if for
+        # a large batch.
+        self.table_backend = resolve_backend(table_backend, JVM_MIN_BATCH)
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.recheck_interval = recheck_interval
+        # Directories holding files skipped as still being written, and the
+        # time.monotonic() at which to look at them again.
+        self.unsettled = {}
+        self._since_evict = 0
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({e}); polling every "
+                      f"{poll_interval} s", file=sys.stderr)
+        self.in_flight = {}
+
+    def _watch(self, directory):
+        if self.inotify is None:
+            return
+        try:
+            self.inotify.add(directory)
+        except OSError as e:
+            # Usually fs.inotify.max_user_watches; polling still works.
+            print(f"{e}; falling back to polling", file=sys.stderr)
+            self.inotify.close()
+            self.inotify = None
+
+    def scan(self, full=False):
+        """Queues new and changed files under root.
+
+        Directories whose mtime is unchanged since the last scan are
+        skipped, unless full: files appear in or disappear from a directory
+        only by changing its mtime. Their subdirectories are still visited.
+        """
+        stack = [self.root]
+        while stack:
+            stack.extend(self._scan_directory(stack.pop(), full))
+        self.db.commit()
+
+    def _scan_directory(self, directory, full):
+        # Queues the directory's new and changed files; returns its
+        # subdirectories, from the state DB if the directory is unchanged.
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+        self._watch(directory)
+        if not full and self.db.dir_mtime(directory) == mtime_ns:
+            return self.db.subdirectories(directory)
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return []
+        subdirectories = [entry.path for entry in entries
+                          if entry.is_dir(follow_symlinks=False)]
+        self.db.set_subdirectories(directory, subdirectories)
+        known = self.db.known_files(directory)
+        now = time.time()
+        found = []
+        settled = True
+        for entry in entries:
+            if not entry.is_file() or not _is_input(entry.name):
+                continue
+            stat = entry.stat()
+            if known.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            if now - stat.st_mtime < self.settle:
+                # Possibly still being written; look again shortly.
+                settled = False
+                continue
+            found.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        self.db.mark_pending(found)
+        if settled:
+            self.unsettled.pop(directory, None)
+            self.db.set_dir_mtime(directory, mtime_ns)
+        else:
+            self.unsettled[directory] = time.monotonic() + self.settle
+        return subdirectories
+
+    def _scan_unsettled(self):
+        now = time.monotonic()
+        for directory, due in list(self.unsettled.items()):
+            if due <= now:
+                self._scan_directory(directory, True)
+        self.db.commit()
+
+    def recheck(self):
+        """Stats every known file and queues those changed in place."""
+        now = time.time()
+        changed = []
+        for path, size, mtime_ns in self.db.files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                continue
+            if now - stat.st_mtime < self.settle:
+                self.unsettled[os.path.dirname(path)] = \
+                    time.monotonic() + self.settle
+                continue
+            changed.append((path, stat.st_size, stat.st_mtime_ns))
+        self.db.mark_pending(changed)
+        self.db.commit()
+
+    def _file_event(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        known = self.db.known_files(os.path.dirname(path))
+        if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+            self.db.mark_pending([(path, stat.st_size, stat.st_mtime_ns)])
+
+    def _handle_events(self, events):
+        rescan = False
+        for path, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+            elif mask & IN_ISDIR:
+                # A new directory: watch it and pick up what is already in it.
+                rescan = True
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and \
+                    _is_input(os.path.basename(path)):
+                self._file_event(path)
+        if rescan:
+            self.scan()
+        self.db.commit()
+
+    def _submit(self, executor):
+        """Queues pending files; returns False if the pool has broken."""
+        room = 2 * self.workers - len(self.in_flight)
+        if room <= 0:
+            return True
+        busy = {path for path, _, _, _ in self.in_flight.values()}
+        for path, size, mtime_ns, done_hash in self.db.pending(
+                room + len(busy)):
+            if path in busy:
+                # Changed while in flight; queued again once it is reaped.
+                continue
+            try:
+                digest = file_digest(path)
+            except OSError as e:
+                self.db.finish(path, size, mtime_ns, FAILED, error=str(e))
+                continue
+            if digest == done_hash:
+                # Touched or copied back unchanged: nothing to redo.
+                self.db.finish(path, size, mtime_ns, DONE, digest)
+                continue
+            output_path = output_path_for(path, self.output_dir, self.root)
+            clash = self.db.same_stem(path)
+            if clash:
+                error = (f"{clash[0]} is also written to {output_path}; "
+                         "rename one of them")
+                self.db.finish(path, size, mtime_ns, FAILED, error=error)
+                print(f"FAILED  {path}: {error}")
+                continue
+            try:
+                future = executor.submit(process_one, path, output_path,
+                                         self.table_backend, self.cache)
+            except BrokenExecutor:
+                # The file stays pending for the next pool.
+                self.db.commit()
+                return False
+            self.in_flight[future] = (path, size, mtime_ns, digest)
+            room -= 1
+            if room == 0:
+                break
+        self.db.commit()
+        return True
+
+    def _reap(self, done):
+        """Records finished files; returns False if the pool has broken."""
+        healthy = True
+        for future in done:
+            path, size, mtime_ns, digest = self.in_flight.pop(future)
+            try:
+                _, ok, error, _, _ = future.result()
+            except BrokenExecutor as e:
+                # A worker died; which file killed it is unknown, so every
+                # file it took down fails and is retried once it changes.
+                ok, error = False, f"{type(e).__name__}: {e}"
+                healthy = False
+            self._since_evict += 1
+            if ok:
+                self.db.finish(path, size, mtime_ns, DONE, digest)
+                print(f"OK      {path}")
+            else:
+                self.db.finish(path, size, mtime_ns, FAILED, error=error)
+                print(f"FAILED  {path}: {error.splitlines()[-1]}")
+        self.db.commit()
+        if self.cache is not None and self._since_evict >= EVICT_EVERY:
+            self._since_evict = 0
+            self.cache.evict()
+        return healthy
+
+    def _executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=init_worker)
+
+    def run(self, full_rescan=False, once=False):
+        """Watches until interrupted; with once, stops once nothing is
+        queued."""
+        if self.cache is not None:
+            self.cache.evict()
+        self.scan(full_rescan)
+        if self.recheck_interval:
+            self.recheck()
+        next_poll = time.monotonic() + self.poll_interval
+        next_recheck = time.monotonic() + self.recheck_interval
+        executor = self._executor()
+        try:
+            while True:
+                healthy = self._submit(executor)
+                if once and not self.in_flight and not self.unsettled \
+                        and healthy:
+                    return
+                if self.in_flight:
+                    done, _ = wait(self.in_flight, timeout=0.2,
+                                   return_when=FIRST_COMPLETED)
+                    healthy = self._reap(done) and healthy
+                    timeout = 0
+                else:
+                    timeout = max(0.0, next_poll - time.monotonic())
+                if not healthy:
+                    # Fail the rest of the dead pool's files and start a
+                    # new one.
+                    self._reap(list(self.in_flight))
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self._executor()
+                    continue
+                if self.inotify is not None:
+                    self._handle_events(self.inotify.read(timeout))
+                else:
+                    time.sleep(timeout)
+                if time.monotonic() >= next_poll:
+                    if self.inotify is None:
+                        self.scan()
+                    if self.unsettled:
+                        self._scan_unsettled()
+                    next_poll = time.monotonic() + self.poll_interval
+                if self.recheck_interval and self.inotify is None and \
+                        time.monotonic() >= next_recheck:
+                    self.recheck()
+                    next_recheck = time.monotonic() + self.recheck_interval
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Process invoices as they arrive in a folder.")
+    parser.add_argument("folder")
+    parser.add_argument("--state-db", default=DEFAULT_STATE_DB,
+                        help="SQLite file recording processed files")
+    parser.add_argument("--output-dir", default="jsons")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--tables", choices=TABLE_BACKENDS, default="tabula",
+                        help="table extraction backend")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds a file must be unmodified before it is "
+                             "picked up by a scan")
+    parser.add_argument("--polling", action="store_true",
+                        help="poll instead of using inotify")
+    parser.add_argument("--recheck-interval", type=float, default=0,
+                        help="stat every known file on startup, and every "
+                             "this many seconds when polling, to catch files "
+                             "rewritten in place (default 0: never)")
+    parser.add_argument("--full-rescan", action="store_true",
+                        help="stat every file on startup, not just those in "
+                             "directories that changed")
+    parser.add_argument("--once", action="store_true",
+                        help="process what is queued, then exit")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always re-extract, ignoring cached results")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-max-mb", type=int, default=512)
+    parser.add_argument("--cache-max-age-days", type=float, default=30)
+    args = parser.parse_args()
+
+    db = StateDB(args.state_db)
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir, args.cache_max_mb << 20,
+                            args.cache_max_age_days * 24 * 3600)
+    watcher = Watcher(args.folder, db, args.output_dir, args.workers,
+                      args.tables, cache, args.poll_interval, args.settle,
+                      not args.polling, args.recheck_interval)
+    try:
+        watcher.run(args.full_rescan, args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
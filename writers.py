@@ -0,0 +1,257 @@
+import csv
+import json
+import math
+import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WRITER_FORMATS = ("ndjson", "csv", "parquet", "arrow", "sqlite")
+
+# Invoice Details keys and the column each is stored in.
+HEADER_FIELDS = (
+    ("Vendor Name", "vendor_name"),
+    ("Invoice Date", "invoice_date"),
+    ("Invoice Number", "invoice_number"),
+    ("Total Amount", "total_amount"),
+)
+INVOICE_COLUMNS = ("source",) + tuple(column for _, column in HEADER_FIELDS)
+# Tables are stored one cell per row so the schema is the same for every
+# invoice however its tables are shaped.
+LINE_ITEM_COLUMNS = ("source", "table_index", "row_index", "column_index",
+                     "column_name", "value")
+
+
+def table_to_split(table):
+    """The same dict as table.to_dict('split'), built column-block-wise,
+    with missing cells (NaN, None, NaT) as None.
+
+    to_dict boxes every cell in a Python loop; to_numpy(dtype=object) does
+    the boxing per block in C and tolist() builds the rows in one call.
+    Missing cells must be None: the stdlib encoder writes NaN, which is not
+    JSON, where orjson writes null.
+    """
+    import pandas as pd
+
+    data = table.to_numpy(dtype=object)
+    data[pd.isna(data)] = None
+    return {"index": table.index.tolist(),
+            "columns": [None if pd.isna(column) else column
+                        for column in table.columns.tolist()],
+            "data": data.tolist()}
+
+
+def _default(value):
+    # NumPy scalars and anything else pandas may leave in a cell.
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def dumps(data, compact=True):
+    """Serializes data to UTF-8 JSON bytes.
+
+    Compact output has no whitespace and uses orjson when it is installed;
+    otherwise the stdlib encoder is used. compact=False gives the indented
+    output of earlier versions.
+    """
+    if not compact:
+        return json.dumps(data, indent=4, default=_default).encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(data, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+
+def _cell(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)
+
+
+def invoice_row(source, data):
+    details = data["Invoice Details"]
+    return (source,) + tuple(_cell(details.get(field))
+                             for field, _ in HEADER_FIELDS)
+
+
+def line_item_rows(source, data):
+    for table_index, table in enumerate(data["Tables"]):
+        columns = table["columns"]
+        for row_index, row in enumerate(table["data"]):
+            for column_index, value in enumerate(row):
+                name = columns[column_index] if column_index < len(columns) \
+                    else None
+                yield (source, table_index, row_index, column_index,
+                       _cell(name), _cell(value))
+
+
+def _run_id():
+    return time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+
+
+class NdjsonWriter:
+    """Writes a batch to one invoices-<run>.ndjson file, one invoice per line.
+
+    Each line is the invoice's usual JSON output with a "source" key added.
+    """
+
+    def __init__(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, f"invoices-{_run_id()}.ndjson")
+        self._file = open(self.path, "ab")
+
+    def append(self, source, data):
+        self._file.write(dumps({"source": source, **data}) + b"\n")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvWriter:
+    """Appends invoices to invoices.csv and line_items.csv in output_dir."""
+
+    def __init__(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        self._files = []
+        self._invoices = self._open(os.path.join(output_dir, "invoices.csv"),
+                                    INVOICE_COLUMNS)
+        self._line_items = self._open(
+            os.path.join(output_dir, "line_items.csv"), LINE_ITEM_COLUMNS)
+
+    def _open(self, path, columns):
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        f = open(path, "a", newline="", encoding="utf-8")
+        self._files.append(f)
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(columns)
+        return writer
+
+    def append(self, source, data):
+        self._invoices.writerow(invoice_row(source, data))
+        self._line_items.writerows(line_item_rows(source, data))
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _ArrowTable:
+    # Buffers rows column-wise and writes a row group every row_group_size.
+
+    def __init__(self, path, schema, file_format, row_group_size):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.columns = [[] for _ in schema.names]
+        if file_format == "parquet":
+            self.writer = pq.ParquetWriter(path, schema)
+            self._write = lambda batch: self.writer.write_table(
+                pa.Table.from_batches([batch]))
+        else:
+            self.writer = pa.ipc.new_file(path, schema)
+            self._write = self.writer.write_batch
+
+    def extend(self, rows):
+        for row in rows:
+            for column, value in zip(self.columns, row):
+                column.append(value)
+        if len(self.columns[0]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+
+        if not self.columns[0]:
+            return
+        batch = pa.record_batch(
+            [pa.array(column, type=field.type)
+             for column, field in zip(self.columns, self.schema)],
+            schema=self.schema)
+        self._write(batch)
+        self.columns = [[] for _ in self.schema.names]
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class ArrowWriter:
+    """Streams invoices into Parquet or Arrow IPC files a row group at a time.
+
+    Each run writes invoices-<run>.<ext> and line_items-<run>.<ext> into
+    output_dir, so a day of runs forms one dataset directory per table that
+    can be read in a single scan.
+    """
+
+    def __init__(self, output_dir, file_format="parquet",
+                 row_group_size=65536):
+        # pyarrow takes longer to import than the rest of the CLI put
+        # together, so it is only loaded when Arrow output is asked for.
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError(f"pyarrow is required for {file_format} "
+                               "output; pip install pyarrow") from None
+        os.makedirs(output_dir, exist_ok=True)
+        run = _run_id()
+        invoice_schema = pa.schema([(name, pa.string())
+                                    for name in INVOICE_COLUMNS])
+        line_item_schema = pa.schema([
+            ("source", pa.string()), ("table_index", pa.int32()),
+            ("row_index", pa.int32()), ("column_index", pa.int32()),
+            ("column_name", pa.string()), ("value", pa.string())])
+        self._invoices = _ArrowTable(
+            os.path.join(output_dir, f"invoices-{run}.{file_format}"),
+            invoice_schema, file_format, row_group_size)
+        self._line_items = _ArrowTable(
+            os.path.join(output_dir, f"line_items-{run}.{file_format}"),
+            line_item_schema, file_format, row_group_size)
+
+    def append(self, source, data):
+        self._invoices.extend([invoice_row(source, data)])
+        self._line_items.extend(line_item_rows(source, data))
+
+    def close(self):
+        self._invoices.close()
+        self._line_items.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_writer(file_format, output_dir):
+    """Returns a writer for one of WRITER_FORMATS."""
+    if file_format == "ndjson":
+        return NdjsonWriter(output_dir)
+    if file_format == "csv":
+        return CsvWriter(output_dir)
+    if file_format in ("parquet", "arrow"):
+        return ArrowWriter(output_dir, file_format)
+    if file_format == "sqlite":
+        from results_db import DEFAULT_DB_NAME, SqliteWriter
+
+        return SqliteWriter(os.path.join(output_dir, DEFAULT_DB_NAME))
+    raise ValueError(f"Unknown output format: {file_format}")